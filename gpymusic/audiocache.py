@@ -0,0 +1,270 @@
+from hashlib import sha1, sha256
+from os import link, listdir, makedirs, remove, replace
+from os.path import getsize, isdir, isfile, join
+from shutil import copyfile
+from threading import Lock
+from time import time
+
+import atexit
+import json
+
+
+class AudioCache():
+    """
+    Keeps songs that have been played on disk, so playing them again
+      doesn't need the network. Files are stored by the hash of their
+      contents, and an index maps song ids to them. Once the cache is
+      over its quota, the least recently played songs are deleted.
+    """
+
+    def __init__(self, path, quota=1024):
+        """
+        AudioCache constructor. The index isn't read until it's needed.
+
+        Arguments:
+        path: Directory to keep songs and the index in.
+
+        Keyword arguments:
+        quota=1024: Max size of the cache in MB.
+        """
+        self.path = path
+        self.index = None  # Song id -> [content hash, size, last played].
+        self.verified = set()  # Hashes checked since we started.
+        self.hits = self.misses = 0
+        self.lock = Lock()
+        self.configure(quota)
+        atexit.register(self.save)
+
+    def configure(self, quota):
+        """
+        Change the cache's quota, deleting songs if it's now too big.
+
+        Arguments:
+        quota: Max size of the cache in MB.
+        """
+        self.quota = max(quota, 0) * 1000000
+        if self.index is not None:
+            with self.lock:
+                self.evict()
+
+    def load(self):
+        """
+        Read the index, if it hasn't been already, and clean up downloads
+          left over from last time. Hold the lock.
+        """
+        if self.index is not None:
+            return
+        self.index = {}
+        incoming = join(self.path, 'incoming')
+        for name in listdir(incoming) if isdir(incoming) else ():
+            try:
+                remove(join(incoming, name))
+            except OSError:
+                pass
+        try:
+            with open(join(self.path, 'index.json')) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):  # Missing or damaged, start fresh.
+            pass
+
+    def save(self):
+        """Write the index to disk."""
+        with self.lock:
+            if self.index is None:
+                return
+            index = dict(self.index)
+        tmp_path = join(self.path, 'index.json.tmp')
+        try:
+            makedirs(self.path, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            replace(tmp_path, join(self.path, 'index.json'))
+        except OSError:  # Not worth crashing over.
+            pass
+
+    def blob_path(self, digest):
+        """
+        Get the location of a stored file.
+
+        Arguments:
+        digest: Hex digest of the file's contents.
+
+        Returns: The path to the file.
+        """
+        return join(self.path, digest[:2], '%s.mp3' % digest)
+
+    def staging(self, id):
+        """
+        Get the location to download a song to before it's added.
+
+        Arguments:
+        id: Song id.
+
+        Returns: A path in the cache's incoming directory.
+        """
+        with self.lock:
+            self.load()  # Clean up before anything is downloaded there.
+        makedirs(join(self.path, 'incoming'), exist_ok=True)
+        name = sha1(id.encode('utf-8')).hexdigest()
+        return join(self.path, 'incoming', '%s.mp3' % name)
+
+    def get(self, id):
+        """
+        Look up a song which is about to be played, counting it as a hit
+          or a miss and marking it as recently played.
+
+        Arguments:
+        id: Song id.
+
+        Returns: The path to the song's file, or None if it isn't cached.
+        """
+        with self.lock:
+            path = self.locate(id)
+            if path is None:
+                self.misses += 1
+                return None
+            self.index[id][2] = time()
+            self.hits += 1
+            return path
+
+    def find(self, id):
+        """
+        Look up a song without counting it as played, i.e. to check
+          whether it needs downloading.
+
+        Arguments:
+        id: Song id.
+
+        Returns: The path to the song's file, or None if it isn't cached.
+        """
+        with self.lock:
+            return self.locate(id)
+
+    def locate(self, id):
+        """
+        Look up a song, making sure that its file is intact. The file is
+          hashed the first time it's used in each session. Hold the lock.
+
+        Arguments:
+        id: Song id.
+
+        Returns: The path to the song's file, or None if it isn't cached.
+        """
+        self.load()
+        entry = self.index.get(id)
+        if entry is None:
+            return None
+        digest, size = entry[0], entry[1]
+        path = self.blob_path(digest)
+        if digest not in self.verified and not (
+                isfile(path) and getsize(path) == size and
+                AudioCache.hash(path) == digest
+        ):
+            self.drop(id)
+            return None
+        self.verified.add(digest)
+        return path
+
+    def add(self, id, path):
+        """
+        Add a downloaded song to the cache.
+
+        Arguments:
+        id: Song id.
+        path: Location of the complete file. It's linked rather than
+          moved, as mpv might be about to open it.
+
+        Returns: The song's new path.
+        """
+        digest, size = AudioCache.hash(path), getsize(path)
+        blob = self.blob_path(digest)
+        with self.lock:
+            self.load()
+            makedirs(join(self.path, digest[:2]), exist_ok=True)
+            if not isfile(blob) or getsize(blob) != size:
+                tmp_path = '%s.tmp' % blob
+                try:
+                    link(path, tmp_path)
+                except OSError:  # No hard links here.
+                    copyfile(path, tmp_path)
+                replace(tmp_path, blob)
+            self.index[id] = [digest, size, time()]
+            self.verified.add(digest)
+            self.evict()
+        self.save()
+        return blob
+
+    def discard(self, id):
+        """
+        Remove a song from the cache, i.e. because its file is damaged.
+          Unknown ids are ignored.
+
+        Arguments:
+        id: Song id.
+        """
+        with self.lock:
+            self.load()
+            if id in self.index:
+                self.drop(id)
+        self.save()
+
+    def drop(self, id):
+        """
+        Remove a song from the cache, deleting its file unless another
+          song shares it. Hold the lock.
+
+        Arguments:
+        id: Song id.
+        """
+        digest = self.index.pop(id)[0]
+        self.verified.discard(digest)
+        if all(entry[0] != digest for entry in self.index.values()):
+            try:
+                remove(self.blob_path(digest))
+            except OSError:
+                pass
+
+    def size(self):
+        """Return the number of bytes stored. Hold the lock."""
+        return sum({e[0]: e[1] for e in self.index.values()}.values())
+
+    def evict(self):
+        """Drop least recently played songs down to quota. Hold the lock."""
+        size = self.size()
+        for id in sorted(self.index, key=lambda id: self.index[id][2]):
+            if size <= self.quota:
+                break
+            digest, blob_size = self.index[id][:2]
+            self.drop(id)
+            if all(entry[0] != digest for entry in self.index.values()):
+                size -= blob_size
+
+    def stats(self):
+        """
+        Get the cache's statistics.
+
+        Returns: A dict with keys 'hits', 'misses', 'songs', and 'size'
+          (in bytes).
+        """
+        with self.lock:
+            self.load()
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'songs': len(self.index), 'size': self.size(),
+            }
+
+    @staticmethod
+    def hash(path):
+        """
+        Hash a file's contents.
+
+        Arguments:
+        path: Location of the file.
+
+        Returns: The file's SHA-256 hex digest.
+        """
+        h = sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from functools import wraps
+from os import replace
+from os.path import isfile
+from threading import Lock
+from time import time
+
+import atexit
+import json
+
+
+class MetadataCache():
+    """
+    Remembers the results of Mobileclient lookups, i.e. get_artist_info,
+      so that expanding the same item twice only hits the network once.
+      Entries expire after a time that depends on their kind, and the
+      least recently used ones are dropped once the cache is full.
+    """
+
+    # Default seconds to keep each kind of entry. Artists' top tracks
+    # change more often than albums' track lists do.
+    ttls = {'songs': 24 * 3600, 'artists': 3600, 'albums': 7 * 24 * 3600}
+
+    def __init__(self, size=256, path=None):
+        """
+        MetadataCache constructor.
+
+        Keyword arguments:
+        size=256: Max number of entries to keep.
+        path=None: File to save the cache to when we exit, and load it
+          from now. None indicates no persistence.
+        """
+        self.entries = OrderedDict()  # Key -> (kind, time stored, data).
+        self.lock = Lock()
+        self.hits = self.misses = 0
+        self.path = None
+        self.configure(size, path)
+
+    def configure(self, size, path=None, ttls=None):
+        """
+        Change the cache's settings.
+
+        Arguments:
+        size: Max number of entries to keep.
+
+        Keyword arguments:
+        path=None: File to persist the cache to, or None.
+        ttls=None: Dict of kind -> seconds, overriding the default TTLs.
+        """
+        self.size = max(size, 0)
+        self.ttls = dict(type(self).ttls, **(ttls or {}))
+        if path is not None and self.path is None:
+            atexit.register(self.save)
+        self.path = path
+        if path is not None:
+            self.load()
+        with self.lock:
+            self.evict()
+
+    def wrap(self, kind, func):
+        """
+        Put the cache in front of a lookup function.
+
+        Arguments:
+        kind: Kind of item the function looks up, i.e. 'artists'.
+        func: Function taking an id and keyword arguments.
+
+        Returns: A function with the same signature which uses the cache.
+        """
+        @wraps(func)
+        def lookup(id, **kwargs):
+            key = MetadataCache.key(kind, id, kwargs)
+            data = self.get(key)
+            if data is None:
+                data = func(id, **kwargs)
+                self.put(key, kind, data)
+            return data
+        return lookup
+
+    @staticmethod
+    def key(kind, id, kwargs):
+        """
+        Build a cache key for a lookup.
+
+        Arguments:
+        kind: Kind of item, i.e. 'artists'.
+        id: The item's id.
+        kwargs: Dict of the lookup's keyword arguments.
+
+        Returns: A string key.
+        """
+        return '%s:%s:%s' % (kind, id, json.dumps(kwargs, sort_keys=True))
+
+    def expired(self, entry):
+        """
+        Check whether an entry is too old to use.
+
+        Arguments:
+        entry: A (kind, time stored, data) tuple.
+
+        Returns: Whether or not the entry has expired.
+        """
+        kind, stored, data = entry
+        return time() - stored > self.ttls.get(kind, 0)
+
+    def get(self, key, usable=None):
+        """
+        Look up an entry, counting the hit or miss.
+
+        Arguments:
+        key: Cache key.
+
+        Keyword arguments:
+        usable=None: Function taking the cached data and returning
+          whether or not it will do. Unusable data counts as a miss.
+
+        Returns: The cached data, or None if it's missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.expired(entry):
+                del self.entries[key]
+                entry = None
+            if entry is not None and usable is not None:
+                entry = entry if usable(entry[2]) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, kind, data):
+        """
+        Add an entry, evicting the least recently used ones if needed.
+
+        Arguments:
+        key: Cache key.
+        kind: Kind of item, for choosing its TTL.
+        data: Data to cache.
+        """
+        with self.lock:
+            self.entries[key] = (kind, time(), data)
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        """Drop entries until the cache is small enough. Hold the lock."""
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Get the cache's statistics.
+
+        Returns: A dict with keys 'hits', 'misses', and 'entries'.
+        """
+        with self.lock:
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries),
+            }
+
+    def load(self):
+        """Read saved entries from disk, skipping any that have expired."""
+        if not isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):  # Unreadable, start fresh.
+            return
+        with self.lock:
+            for key, kind, stored, data in saved:
+                entry = (kind, stored, data)
+                if key not in self.entries and not self.expired(entry):
+                    self.entries[key] = entry
+
+    def save(self):
+        """Write the unexpired entries to disk."""
+        if self.path is None:
+            return
+        with self.lock:
+            saved = [
+                [key] + list(entry) for key, entry in self.entries.items()
+                if not self.expired(entry)
+            ]
+        tmp_path = '%s.tmp' % self.path
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(saved, f)
+            replace(tmp_path, self.path)
+        except OSError:  # Not worth crashing over.
+            pass
+
+
+class SearchCache(MetadataCache):
+    """
+    Remembers recent search results. Queries which only differ in case
+      or spacing share results, and results fetched for a large limit
+      also serve any smaller one.
+    """
+
+    ttls = {'search': 600}
+
+    def __init__(self, func, size=64):
+        """
+        SearchCache constructor.
+
+        Arguments:
+        func: Search function, i.e. Mobileclient.search.
+
+        Keyword arguments:
+        size=64: Max number of queries to remember.
+        """
+        super().__init__(size)
+        self.func = func
+
+    @staticmethod
+    def normalize(query):
+        """
+        Reduce a query to the form we cache it under.
+
+        Arguments:
+        query: Search query.
+
+        Returns: The query in lower case, with runs of whitespace collapsed.
+        """
+        return ' '.join(query.casefold().split())
+
+    def search(self, query, limit):
+        """
+        Search, using cached results if possible.
+
+        Arguments:
+        query: Search query.
+        limit: Max number of results of each type.
+
+        Returns: A dict like the search function's, with at most
+          'limit' hits of each type.
+        """
+        key = SearchCache.normalize(query)
+        cached = self.get(key, usable=lambda data: data[0] >= limit)
+        if cached is None:
+            result = self.func(query, max_results=limit)
+            self.put(key, 'search', (limit, result))
+        else:
+            result = cached[1]
+        return {
+            k: v[:limit] if isinstance(v, list) else v
+            for k, v in result.items()
+        }
@@ -1,18 +1,24 @@
 from . import common
+from . import download
+from . import index
+from . import library
 from . import music_objects
+from . import playlist
 
 import json
-import zipfile
 
+from concurrent.futures import ThreadPoolExecutor
 from os.path import exists, isfile, join
-from random import shuffle
-
-from gmusicapi import Musicmanager
+from threading import Event, Thread
+from time import localtime, strftime
 
 
 class Client:
     """Driver for most of gpymusic's functionality."""
 
+    # Max number of items to look up or download at once.
+    fill_jobs = 8
+
     def transition(self, input=""):
         """
         Route input to the appropriate function.
@@ -36,16 +42,19 @@ class Client:
             'write': self.write,
             'r': self.restore,
             'restore': self.restore,
+            'refresh': self.refresh,
+            'stats': self.stats,
         }
 
         arg = None
-        if common.v.is_empty():
-            common.w.addstr(
-                common.w.infobar,
-                'Enter \'h\' or \'help\' if you need help.'
-            )
-        else:
-            common.w.now_playing()
+        if not common.player.playing:
+            if common.v.is_empty():
+                common.w.addstr(
+                    common.w.infobar,
+                    'Enter \'h\' or \'help\' if you need help.'
+                )
+            else:
+                common.w.now_playing()
 
         user_input = common.w.get_input() if not input else input
         try:
@@ -70,27 +79,61 @@ class Client:
         if not common.w.curses:
             return
 
-        common.w.main.erase()
-        common.w.main.addstr(
+        with common.w.lock:  # Other threads draw too.
+            common.w.main.erase()
+            common.w.main.addstr(
         """
         Commands:
         s/search search-term: Search for search-term
         e/expand 123: Expand item number 123
-        radio 123: Create radio station around item number 123
+        radio 123: Play an endless radio station around item number 123
         p/play: Play the current queue
         p/play s: Shuffle and play the current queue
         p/play 123: Play item number 123
+        space/x/n: Pause/stop/skip while playing (with an empty prompt)
         q/queue: Show the current queue
         q/queue 123: Add item number 123 to the queue
         q/queue 1 2 3: Add items 1, 2, and 3 to the queue
+        q/queue 1-10: Add items 1 through 10 to the queue
         q/queue c: Clear the current queue
         w/write playlist-name: Write current queue to playlist playlist-name
         r/restore playlist-name: Replace the current queue with a playlist
+        refresh: Sync your library in the background (free accounts only)
+        stats: Show how well lookups and searches are being cached
+        PgUp/PgDn: Scroll through long lists
         h/help: Show this help message
         Ctrl-C: Exit gpymusic
         """  # noqa
-        )
-        common.w.main.refresh()
+            )
+            common.w.main.refresh()
+            common.w.inbar.refresh()  # Put the cursor back.
+            common.w.frame = None  # The next display redraws everything.
+
+    def more(self):
+        """Show more of the current results, if there are any."""
+        pass
+
+    def stats(self, arg=None):
+        """
+        Display cache statistics.
+
+        Keyword arguments:
+        arg=None: Irrelevant.
+        """
+        msgs = []
+        for name, c in (('Lookups', common.mdc), ('Searches', common.sc)):
+            s = c.stats()
+            total = s['hits'] + s['misses']
+            msgs.append('%s: %d cached of %d (%d%%), %d stored.' % (
+                name, s['hits'], total,
+                100 * s['hits'] / total if total else 0, s['entries'],
+            ))
+        s = common.ac.stats()
+        msgs.append('Audio: %d from disk of %d, %d songs (%d MB) stored.' % (
+            s['hits'], s['hits'] + s['misses'], s['songs'],
+            s['size'] / 1000000,
+        ))
+        common.w.outbar_msg(' '.join(msgs))
 
     def write(self, fn=None):
         """
@@ -111,8 +154,7 @@ class Client:
             common.w.error_msg('Playist %s already exists' % fn)
 
         else:  # Write the playlist.
-            with open(join(path, fn), 'w') as f:
-                json.dump(common.q, f)
+            playlist.save(join(path, fn), common.q)
             common.w.outbar_msg('Wrote queue to %s.' % fn)
 
     def restore(self, fn=None):
@@ -131,13 +173,17 @@ class Client:
 
         else:
             common.w.outbar_msg('Restoring queue from %s...' % fn)
-            try:  # Read the playlist.
-                with open(join(path, fn)) as f:
-                    json_songs = json.load(f)
-            except json.decoder.JSONDecodeError:  # Bad file.
+            try:  # Read the playlist, streaming it if it's compact.
+                if playlist.is_compact(join(path, fn)):
+                    songs = playlist.load(join(path, fn))
+                else:
+                    with open(join(path, fn)) as f:
+                        songs = json.load(f)
+            except ValueError:  # Bad file.
                 common.w.error_msg('%s is not a valid playlist file' % fn)
             else:
-                common.q.restore(json_songs)
+                common.radio.stop()
+                common.q.restore(songs)
 
     def queue(self, arg=None):
         """
@@ -152,18 +198,14 @@ class Client:
             if not common.q:  # Nothing to display.
                 common.w.error_msg('The queue is empty')
 
-            else:  # Display the queue.
-                if common.w.curses:
-                    # Allow room for header.
-                    limit = common.w.ylimit - 2
-                else:
-                    limit = -1
-                common.v.replace(common.q.collect(limit))
+            else:  # Display the queue. It scrolls, so show all of it.
+                common.v.replace(common.q.collect())
 
             return
 
         if arg in ('c', 'C'):  # Clear the queue.
-            del common.q[:]
+            common.radio.stop()
+            common.q.clear()
             common.w.outbar_msg('Cleared queue.')
             return
 
@@ -175,26 +217,32 @@ class Client:
             num = int(arg)
         except ValueError:
             try:  # Check for multi-option argument.
-                nums = [int(i) for i in arg.split()]
+                nums = Client.parse_nums(arg, len(common.v))
             except ValueError:  # Invalid argument.
                 common.w.error_msg('Invalid argument to queue')
-
-            else:  # Add all arguments to the queue.
-                common.w.outbar_msg('Adding items to the queue...')
-                items = [self.get_option(num) for num in nums]
-                count = common.q.extend(
-                    [item for item in items if item is not None]
-                )
-                common.w.outbar_msg(
-                    'Added %d song%s to the queue.' %
-                    (count, '' if count is 1 else 's')
+                return
+            except IndexError:
+                common.w.error_msg(
+                    'Index out of range: valid between 1-%d' % len(common.v)
                 )
+                return
+
+            # Add all arguments to the queue, other than artists.
+            common.w.outbar_msg('Adding items to the queue...')
+            items = self.get_options([
+                num for num in nums if common.v.locate(num)[0] != 'artists'
+            ])
+            count = common.q.extend(
+                [item for item in items if item is not None]
+            )
+            common.w.outbar_msg(
+                'Added %d song%s to the queue.' %
+                (count, '' if count is 1 else 's')
+            )
 
         else:
-            if (
-                    num > len(common.v['songs']) and
-                    num <= len(common.v['songs']) + len(common.v['artists'])
-            ):
+            location = common.v.locate(num)
+            if location is not None and location[0] == 'artists':
                 common.w.error_msg(
                     'Can only add songs or albums to the queue.'
                 )
@@ -208,7 +256,56 @@ class Client:
                         (count, '' if count is 1 else 's')
                     )
 
-    def get_option(self, num, limit=-1):
+    def get_options(self, nums, limit=-1):
+        """
+        Select several numbered MusicObjects from the main window. Their
+          lookups or downloads run in parallel, so selecting many items
+          takes about as long as the slowest one.
+
+        Arguments:
+        nums: Indices of the MusicObjects in the main window.
+
+        Keyword argumnents:
+        limit=-1: Number of songs to generate for artists,
+          determined by terminal height.
+
+        Returns: The MusicObjects in the order of 'nums', with None in
+          place of invalid indices.
+        """
+        items = [self.get_option(num, limit, fill=False) for num in nums]
+        # Items selected twice only need to be filled once.
+        unique = list({id(i): i for i in items if i is not None}.values())
+        if unique:
+            with ThreadPoolExecutor(
+                    max_workers=min(len(unique), Client.fill_jobs)
+            ) as pool:
+                # Waiting on whole downloads keeps fill_jobs of them at once.
+                list(pool.map(
+                    lambda item: Client.fill(item, limit, wait=True), unique
+                ))
+        return items
+
+    @staticmethod
+    def fill(item, limit=-1, wait=False):
+        """
+        Fill in a MusicObject with as much content as we can display.
+
+        Arguments:
+        item: The MusicObject to fill in.
+
+        Keyword argumnents:
+        limit=-1: Number of songs to generate for artists,
+          determined by terminal height.
+        wait=False: Whether or not to wait for a library song's whole
+          download, rather than only until it can start playing.
+        """
+        item.fill(music_objects.mapping[item['kind'] + 's']['lookup'], limit)
+        if wait and item['kind'] == 'libsong':
+            dl = download.active.get(common.ac.staging(item['id']))
+            if dl is not None:
+                dl.finished.wait()
+
+    def get_option(self, num, limit=-1, fill=True):
         """
         Select a numbered MusicObject from the main window.
 
@@ -218,28 +315,54 @@ class Client:
         Keyword argumnents:
         limit=-1: Number of songs to generate for artists,
           determined by terminal height.
+        fill=True: Whether or not to fill in the item before returning it.
 
         Returns: The MusicObject at index 'num'.
         """
-        total = sum(len(common.v[k]) for k in common.v.keys())
-        if num < 0 or num > total:
+        location = common.v.locate(num)
+        if location is None:
             common.w.error_msg(
-                'Index out of range: valid between 1-%d' % total
+                'Index out of range: valid between 1-%d' % len(common.v)
             )
             return None
 
-        i = 1
-        for key in ('songs', 'artists', 'albums'):  # Guarantee order.
-            for item in common.v[key]:
-                if i == num:
-                    # Return item with as much content as we can display.
-                    item.fill(
-                        music_objects.mapping[item['kind'] + 's']['lookup'],
-                        limit
-                    )
-                    return item
-                else:
-                    i += 1
+        key, i = location
+        item = common.v[key][i]
+        if fill:
+            Client.fill(item, limit)
+        return item
+
+    @staticmethod
+    def parse_nums(arg, limit=-1):
+        """
+        Parse a list of item numbers.
+
+        Arguments:
+        arg: Space-delimited numbers and ranges, i.e. '1 2 5-10'.
+
+        Keyword arguments:
+        limit=-1: Largest valid number. -1 indicates no limit.
+
+        Returns: A list of numbers, with ranges expanded in order.
+          Raises ValueError if arg is malformed, or IndexError if a number
+          isn't between 1 and limit. Ranges are checked before they're
+          expanded, so a huge one is rejected right away.
+        """
+        def check(num):
+            if limit != -1 and not 1 <= num <= limit:
+                raise IndexError(num)
+            return num
+
+        nums = []
+        for part in arg.split():
+            first, dash, last = part.partition('-')
+            if not dash:
+                nums.append(check(int(part)))
+            else:
+                first, last = check(int(first)), check(int(last))
+                step = 1 if last >= first else -1
+                nums.extend(range(first, last + step, step))
+        return nums
 
     def play(self, arg=None):
         """
@@ -254,16 +377,9 @@ class Client:
                 common.w.error_msg('The queue is empty')
             else:  # Play the queue.
                 if arg is 's':  # Shuffle.
-                    shuffle(common.q)
-                if common.w.curses:
-                    # Allow room for header.
-                    limit = common.w.ylimit - 1
-                else:
-                    limit = -1
-                    common.v.replace(common.q.collect(limit))
-                common.w.display()
+                    common.q.shuffle()
                 common.w.outbar_msg(
-                    '[spc] pause [q] stop [n] next [9-0] volume [arrows] seek')
+                    '[spc] pause [x] stop [n] next [9-0] volume [arrows] seek')
                 common.q.play()
             return
 
@@ -281,15 +397,9 @@ class Client:
 
             if item is not None:  # Valid input.
                 common.w.outbar_msg(
-                    '[spc] pause [q] stop [n] next [9-0] volume [arrows] seek'
+                    '[spc] pause [x] stop [n] next [9-0] volume [arrows] seek'
                 )
-                if item['kind'] == 'libsong':  # This is hacky and bad.
-                    common.w.now_playing(
-                        '(1/1) %s (%s)' % (str(item), item['time'])
-                    )
                 item.play()
-                common.w.now_playing()
-                common.w.erase_outbar()
 
 
 class FreeClient(Client):
@@ -305,67 +415,150 @@ class FreeClient(Client):
         Log into Musicmanager and get the library, either by loading an
           existing library file, or by generating a new one.
         """
+        from gmusicapi import Musicmanager  # Slow to import, so wait.
+
         self.kind = 'free'
         self.mm = Musicmanager()
         self.mm.login()
-        self.songs = []
+        self.library = library.Library(join(common.DATA_DIR, 'library.db'))
+        self.index = index.SearchIndex()
+        self.indexed = Event()  # Set once the index has every song.
+        self.syncing = None  # Background refresh thread.
         self.load_library()
-        if not self.songs:
+        if not len(self.library):
             self.gen_library()
 
     def load_library(self):
-        path = join(common.DATA_DIR, 'library.zip')
+        """
+        Open the library, importing an old library.zip file first if there
+          is one, and start building the search index in the background.
+        """
         common.w.outbar_msg('Loading library...')
-        if not isfile(path):
-            common.w.addstr(common.w.infobar, 'Could not find library file.')
-            return
-        try:
-            with zipfile.ZipFile(path) as z:
-                try:
-                    lib = json.loads(z.read('library.json').decode('utf-8'))
-                except json.JSONDecodeError:  # The .json file is invalid.
-                    common.w.addstr(
-                        common.w.infobar, 'Library file is corrupt.'
-                    )
-                    return
-        except zipfile.BadZipFile:  # The .zip file is invalid.
-            common.w.addstr(common.w.infobar, 'Library file is corrupt.')
+        if not len(self.library):
+            path = join(common.DATA_DIR, 'library.zip')
+            if not isfile(path):
+                common.w.addstr(
+                    common.w.infobar, 'Could not find library file.'
+                )
+            elif not self.library.migrate(path):
+                common.w.addstr(common.w.infobar, 'Library file is corrupt.')
+        Thread(target=self.build_index, daemon=True).start()
+        if not len(self.library):
             return
 
-        for item in lib['songs']:
-            try:
-                self.songs.append(
-                    music_objects.LibrarySong(item, source='json'))
-            except KeyError:  # The file has the wrong data.
-                common.w.addstr(common.w.infobar, 'Library file is corrupt.')
-                return
+        l = len(self.library)
+        synced = self.library.last_sync
+        if synced is not None:
+            synced = strftime('%Y-%m-%d %H:%M', localtime(synced))
+        common.w.outbar_msg('Loaded %s song%s%s.' % (
+            l, '' if l is 1 else 's',
+            '' if synced is None else ', last refreshed %s' % synced
+        ))
 
-        l = len(self.songs)
-        common.w.outbar_msg('Loaded %s song%s.' % (l, '' if l is 1 else 's'))
+    def build_index(self):
+        """
+        Index every song in the library. Reading a large library takes a
+          few seconds, so this runs in the background, and searches go
+          to the database until it's done.
+        """
+        for row in self.library.rows():
+            self.index.add(*row)
+        self.indexed.set()
+
+    def sync_library(self):
+        """
+        Bring the library up to date with Google Play Music. Only songs
+          which were added, removed, or changed since the last sync are
+          written to the library and search index.
+
+        Returns: A tuple of (added/changed, removed) song counts.
+        """
+        # Changes made while the index is being built could be undone
+        # by rows that it read before them.
+        self.indexed.wait()
+        known = self.library.fingerprints()
+        seen = set()  # Avoid duplicates between purchased and uploaded songs.
+        changed = removed = 0
+
+        for pages in (
+                self.mm.get_uploaded_songs(incremental=True),
+                self.mm.get_purchased_songs(incremental=True),
+        ):
+            for page in pages:  # Apply changes one page at a time.
+                songs, fingerprints = [], {}
+                for song in page:
+                    if song['id'] in seen:
+                        continue
+                    seen.add(song['id'])
+                    fingerprint = library.Library.fingerprint(song)
+                    if known.get(song['id']) != fingerprint:
+                        songs.append(music_objects.LibrarySong(song))
+                        fingerprints[song['id']] = fingerprint
+                self.add_songs(songs, fingerprints)
+                changed += len(songs)
+
+        gone = set(known) - seen
+        if gone:
+            self.library.remove(gone)
+            for id in gone:
+                self.index.remove(id)
+            removed = len(gone)
+        self.library.mark_synced()
+
+        return changed, removed
 
     def gen_library(self):
-        ids = []  # Avoid duplicates between purchased and uploaded songs.
+        """Generate the library from scratch, blocking until it's done."""
         common.w.outbar_msg('Generating your library...')
-
-        for song in self.mm.get_uploaded_songs():
-            if song['id'] not in ids:
-                self.songs.append(music_objects.LibrarySong(song))
-                ids.append(song['id'])
-        for song in self.mm.get_purchased_songs():
-            if song['id'] not in ids:
-                self.songs.append(music_objects.LibrarySong(song))
-                ids.append(song['id'])
-        # Todo: Use something other than json for library storage since it
-        # doesn't really make logical sense (songs is a list, not a dict),
-        # but for now it's very easy to use.
-        with zipfile.ZipFile(join(common.DATA_DIR, 'library.zip'), 'w') as z:
-            z.writestr('library.json', json.dumps({'songs': self.songs}))
-        l = len(self.songs)
+        self.sync_library()
+        l = len(self.library)
         common.w.outbar_msg(
             'Generated %d song%s.' % (l, '' if l is 1 else 's')
         )
         common.w.now_playing()
 
+    def refresh(self, arg=None):
+        """
+        Sync the library in the background.
+
+        Keyword arguments:
+        arg=None: Irrelevant.
+        """
+        if self.syncing is not None and self.syncing.is_alive():
+            common.w.error_msg('The library is already being refreshed')
+            return
+
+        def sync():
+            try:
+                changed, removed = self.sync_library()
+            except Exception:  # Most likely a network error.
+                common.w.error_msg('Could not refresh the library')
+            else:
+                common.w.outbar_msg(
+                    'Refreshed library: %d added or changed, %d removed.' %
+                    (changed, removed)
+                )
+
+        self.syncing = Thread(target=sync, daemon=True)
+        self.syncing.start()
+        common.w.outbar_msg('Refreshing library in the background...')
+
+    def add_songs(self, songs, fingerprints=None):
+        """
+        Save songs to the library and make them searchable.
+
+        Arguments:
+        songs: List of LibrarySongs to add.
+
+        Keyword arguments:
+        fingerprints=None: Dict of song id -> fingerprint to store.
+        """
+        self.library.upsert(songs, fingerprints)
+        for song in songs:
+            self.index.add(
+                song['id'], song['name'], song['artist'], song['album']
+            )
+
     def expand(self, arg=None):
         """
         Artists/albums cannot be generated. so free users cannot expand songs..
@@ -400,20 +593,16 @@ class FreeClient(Client):
         # Save the current view in case there are no results.
         cache = common.v.copy()
 
-        if common.w.curses:
-            limit = common.w.ylimit - 4
-        else:
-            limit = 10
+        # The view scrolls, so we aren't limited by the terminal height.
+        limit = 500 if common.w.curses else 10
         common.w.outbar_msg('Searching for \'%s\'...' % query)
         common.v.clear()
-        count, query = 0, query.lower()  # Search is case-insensitive.
-        for song in self.songs:
-            if any(query in song[k].lower()
-                   for k in ('name', 'artist', 'album')):
-                count += 1
+        # Results come back ranked, best matches first.
+        results = self.index if self.indexed.is_set() else self.library
+        for id in results.search(query, limit):
+            song = self.library.get(id)
+            if song is not None:  # Removed by a refresh since.
                 common.v['songs'].append(song)
-                if count == limit:
-                    break
         common.w.outbar_msg('Search returned %d results.' % len(common.v))
 
         if common.v.is_empty():
@@ -422,8 +611,17 @@ class FreeClient(Client):
 
 class FullClient(Client):
     """Client for paid account users with full functionality."""
+
+    # Max number of results of each type that a search can return.
+    search_max = 100
+
     def __init__(self):
         self.kind = 'full'
+        # Query, results shown of each type, and the song list they're
+        # in, for the search that's being scrolled through.
+        self.paging = None
+        self.pages = ThreadPoolExecutor(max_workers=1)
+        self.next_page = (None, None)  # (Query, limit) and its Future.
 
     def expand(self, num=None):
         """
@@ -456,6 +654,16 @@ class FullClient(Client):
                 common.v.replace(item.collect(limit=limit))
                 common.w.erase_outbar()
 
+    def refresh(self, arg=None):
+        """
+        Full users stream from Google Play Music, so there's no library
+          to refresh.
+
+        Keyword arguments:
+        arg=None: Irrelevant.
+        """
+        common.w.error_msg('Only free users have a library to refresh')
+
     def radio(self, num=None):
         """
         Create a radio station based on a specific song, artist, or album.
@@ -481,30 +689,8 @@ class FullClient(Client):
         else:
             item = self.get_option(num)
             if item is not None:  # Valid input.
-                station_name = item['name']+" radio"
-                item_id = item['id']
-                if item['kind'] == 'artist':
-                    station_id = common.mc.create_station(
-                        station_name,
-                        artist_id=item_id,
-                    )
-                elif item['kind'] == 'album':
-                    station_id = common.mc.create_station(
-                        station_name,
-                        album_id=item_id,
-                    )
-                elif item['kind'] == 'song':
-                    station_id = common.mc.create_station(
-                        station_name,
-                        track_id=item_id,
-                    )
-
-                limit = int((common.w.ylimit - 3)) if common.w.curses else 50
-
-                del common.q[:]  # Clear current queue
-                # pull limit songs from radio station and add them to queue
-                common.q.extend(music_objects.Song(song)
-                                for song in common.mc.get_station_tracks(station_id, num_tracks=limit))
+                common.w.outbar_msg('Tuning in to %s radio...' % item['name'])
+                common.radio.start(item)
                 common.w.erase_outbar()
                 self.queue()  # show the queue
 
@@ -524,30 +710,92 @@ class FullClient(Client):
         cache = common.v.copy()
 
         # Fetch as many results as we can display depending on terminal height.
-        if common.w.curses:
-            limit = int((common.w.ylimit - 3) / 3)
-        else:
-            limit = 50
+        limit = self.page_size()
 
         common.w.outbar_msg('Searching for \'%s\'...' % query)
-        result = common.mc.search(query, max_results=limit)
+        result = common.sc.search(query, limit)
         common.w.erase_outbar()
 
-        # 'class' => class of MusicObject
-        # 'hits' => key in search result
-        # 'rslt_key' => per-entry key in search result
         common.v.clear()
-        iters = {k: iter(result[music_objects.mapping[k]['hits']])
-                 for k in common.v.keys()}
-        # Create at most 'limit' of each type.
-        for i in range(limit):
-            for k in iters.keys():
-                try:
-                    common.v[k].append(music_objects.mapping[k]['cls'](
-                        next(iters[k])[music_objects.mapping[k]['rslt_key']]))
-                except StopIteration:
-                    pass
+        self.add_results(result)
         common.w.outbar_msg('Search returned %d results.' % len(common.v))
+        self.paging = (query, limit, common.v['songs'])
+        if limit < FullClient.search_max:
+            self.fetch_page(query, min(limit * 2, FullClient.search_max))
 
         if common.v.is_empty():
             common.v.replace(cache)
+
+    def page_size(self):
+        """
+        Get the number of search results of each type in a page.
+
+        Returns: As many as fit on the screen, or 50 without curses.
+        """
+        if common.w.curses:
+            return max(int((common.w.ylimit - 3) / 3), 1)
+        return 50
+
+    def add_results(self, result):
+        """
+        Add search results to the view, skipping any already in it.
+
+        Arguments:
+        result: Dict of results from Mobileclient.search.
+        """
+        # 'new' => function building a MusicObject
+        # 'hits' => key in search result
+        # 'rslt_key' => per-entry key in search result
+        for k in common.v.keys():
+            m = music_objects.mapping[k]
+            seen = set(item['id'] for item in common.v[k])
+            for hit in result[m['hits']]:
+                item = m['new'](hit[m['rslt_key']])
+                if item['id'] not in seen:
+                    seen.add(item['id'])
+                    common.v[k].append(item)
+
+    def fetch_page(self, query, limit):
+        """
+        Get the next page of a search ready in the background, so that
+          it's in the search cache by the time we scroll down to it.
+
+        Arguments:
+        query: Search query.
+        limit: Number of results of each type that the page ends at.
+        """
+        self.next_page = (
+            (query, limit), self.pages.submit(common.sc.search, query, limit)
+        )
+
+    def more(self):
+        """
+        Add the next page of results for the search being shown. The api
+          has no offsets, so a page is a longer search whose new results
+          are appended.
+        """
+        if (
+                self.paging is None or common.v.is_empty() or
+                self.paging[2] is not common.v['songs']
+        ):
+            return  # The search isn't being shown any more.
+        query, limit, songs = self.paging
+        if limit >= FullClient.search_max:
+            return
+        page = self.page_size()
+        limit = min(limit + page, FullClient.search_max)
+
+        key, future = self.next_page
+        if key == (query, limit):  # Let the prefetch finish, not repeat it.
+            try:
+                future.result()
+            except Exception:  # We'll try again ourselves.
+                pass
+
+        before = len(common.v)
+        self.add_results(common.sc.search(query, limit))
+        self.paging = (query, limit, songs)
+        if len(common.v) > before:
+            common.w.display()
+        if limit < FullClient.search_max:
+            self.fetch_page(query, min(limit + page, FullClient.search_max))
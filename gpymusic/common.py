@@ -1,8 +1,17 @@
-from gmusicapi import Mobileclient
+from . import lazy
 # Imports are stupid.
-mc = Mobileclient()  # noqa Our interface to Google Play Music.
+# Our interface to Google Play Music, created when it's first used.
+mc = lazy.Lazy('gmusicapi', 'Mobileclient')  # noqa
+from . import cache  # noqa
+mdc = cache.MetadataCache()  # noqa Remembers artist, album, and song lookups.
+sc = cache.SearchCache(lambda *a, **kw: mc.search(*a, **kw))  # noqa Remembers recent searches.
 
+from . import audiocache
+from . import loop
 from . import nowplaying
+from . import player
+from . import prefetch
+from . import radio
 from . import songqueue
 from . import view
 from . import writer
@@ -12,11 +21,16 @@ from os.path import expanduser, join
 
 # Location where we keep songs, playlists, libraries, and source code.
 DATA_DIR = join(expanduser('~'), '.local', 'share', 'gpymusic')
-# Location where we keep user and mpv configurations.
+# Location where we keep the user configuration.
 CONFIG_DIR = join(expanduser('~'), '.config', 'gpymusic')
 
 q = songqueue.Queue()  # Queue/playlist.
+ac = audiocache.AudioCache(join(DATA_DIR, 'audio'))  # Songs played before.
 w = writer.Writer(None, None, None, None, curses=False)  # Output handler.
 v = view.View()  # Main window contents.
 np = nowplaying.NowPlaying()
+pf = prefetch.Prefetcher()  # Gets upcoming songs ready.
+player = player.Player()  # Our mpv instance, started on demand.
+radio = radio.Radio()  # Keeps the queue topped up while a station plays.
+loop = loop.EventLoop()  # Runs commands and handles keypresses.
 client = None  # To be set in the main executable.
@@ -0,0 +1,454 @@
+from . import common
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import remove, replace
+from os.path import getsize, isfile, join
+from threading import Condition, Event, Lock, Thread, local
+from time import sleep, time
+
+import json
+
+
+CHUNK_SIZE = 64 * 1024  # Bytes to read from the network at a time.
+BUFFER_SIZE = 256 * 1024  # Bytes to download before playback can start.
+
+active = {}  # Path -> Download, for songs being downloaded right now.
+active_lock = Lock()
+
+
+def song_path(name, artist, album):
+    """
+    Get the location of a downloaded library song.
+
+    Arguments:
+    name/artist/album: The song's title, artist name, and album name.
+
+    Returns: The path to the song's mp3 file.
+    """
+    # Can't have '/' in filenames so replace with them with something
+    # that will (hopefully) never occur naturally.
+    filename = ' - '.join((name, artist, album)).replace('/', '---')
+    return join(common.DATA_DIR, 'songs', '%s.mp3' % filename)
+
+
+def stream(mm, id):
+    """
+    Start downloading a song without reading it.
+
+    Arguments:
+    mm: Logged in Musicmanager.
+    id: Id of the song to download.
+
+    Returns: A requests.Response whose body hasn't been read yet.
+    """
+    from gmusicapi.protocol import musicmanager as protocol  # Slow import.
+
+    # Musicmanager.download_song reads the whole song into memory,
+    # so we make the same calls ourselves and ask for a stream instead.
+    url = mm._make_call(
+        protocol.GetDownloadLink, id, mm.uploader_id
+    )['url']
+    request = protocol.DownloadTrack.build_request(url)
+    request['stream'] = True
+    response = mm.session.send(request, protocol.DownloadTrack.required_auth)
+    response.raise_for_status()
+    return response
+
+
+def open_url(url):
+    """
+    Start downloading a streamed song without reading it.
+
+    Arguments:
+    url: The song's stream url.
+
+    Returns: A requests.Response whose body hasn't been read yet.
+    """
+    import requests  # Slow to import, and only needed here.
+
+    response = requests.get(url, stream=True, timeout=30)
+    response.raise_for_status()
+    return response
+
+
+def fetch(mm, id, path, progress=None, url=None, in_place=False):
+    """
+    Download a song, writing it to disk as it arrives. The file is
+      written under a temporary name and renamed once it's complete,
+      so an interrupted download never leaves a partial file at path.
+
+    Arguments:
+    mm: Logged in Musicmanager.
+    id: Id of the song to download.
+    path: Where to save the song.
+
+    Keyword arguments:
+    progress=None: Function called with (bytes written, expected size)
+      after each chunk. The expected size is None if it isn't known.
+    url=None: Stream url to download from instead of the Musicmanager,
+      for songs from the store.
+    in_place=False: Write straight to path instead, so that a player
+      reading the song never sees it move. Whether or not it's complete
+      is then up to the caller to keep track of.
+
+    Returns: The number of bytes written.
+    """
+    tmp_path = path if in_place else partial_path(path)
+    if in_place and isfile(path):
+        # It might be linked into the audio cache, so don't write over it.
+        remove(path)
+    try:
+        response = stream(mm, id) if url is None else open_url(url)
+        length = response.headers.get('Content-Length')
+        length = int(length) if length is not None else None
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                f.flush()  # Let players read it right away.
+                size += len(chunk)
+                if length is not None and size > length:
+                    raise IOError('Received more data than expected')
+                if progress is not None:
+                    progress(size, length)
+        if length is not None and size != length:
+            raise IOError('Download ended early (%d/%d bytes)' %
+                          (size, length))
+        if not in_place:
+            replace(tmp_path, path)
+    except BaseException:
+        if isfile(tmp_path):
+            remove(tmp_path)
+        raise
+    return size
+
+
+def partial_path(path):
+    """
+    Get the location of an unfinished download.
+
+    Arguments:
+    path: Where the song will be saved once it's complete.
+
+    Returns: The temporary path.
+    """
+    return '%s.part' % path
+
+
+def start(mm, id, path, callback=None, rate=None, url=None):
+    """
+    Download a song in the background, or join a download of it which
+      is already running.
+
+    Arguments:
+    mm: Logged in Musicmanager.
+    id: Id of the song to download.
+    path: Where to save the song.
+
+    Keyword arguments:
+    callback=None: Function called with the Download when it finishes.
+    rate=None: Max download speed in bytes per second, or None for no limit.
+      Joining a running download lifts its limit if rate is None.
+    url=None: Stream url to download from, see fetch().
+
+    Returns: The Download.
+    """
+    with active_lock:
+        dl = active.get(path)
+        if dl is not None and rate is None and dl.rate is not None:
+            dl.rate = None  # Someone's waiting on it now.
+        if dl is None:
+            dl = active[path] = Download(mm, id, path, rate, url)
+            dl.thread.start()
+        if callback is not None:
+            dl.callbacks.append(callback)
+    return dl
+
+
+class Download():
+    """
+    A song being downloaded in the background, which can be
+      played before it's finished. It's written straight to its path,
+      so a player which opens it late still finds it there. The song
+      is complete once it's been removed from active.
+    """
+
+    def __init__(self, mm, id, path, rate=None, url=None):
+        """
+        Download constructor. Use start() rather than creating these.
+
+        Arguments:
+        mm: Logged in Musicmanager.
+        id: Id of the song to download.
+        path: Where to save the song.
+
+        Keyword arguments:
+        rate=None: Max download speed in bytes per second, or None.
+        url=None: Stream url to download from, see fetch().
+        """
+        self.mm = mm
+        self.url = url
+        self.id = id
+        self.path = path
+        self.rate = rate
+        self.started = time()
+        self.size = 0  # Bytes written so far.
+        self.error = None  # Exception which ended the download.
+        self.callbacks = []
+        self.finished = Event()
+        self.written = Condition()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def run(self):
+        """Download the song, then let everyone know."""
+        try:
+            fetch(
+                self.mm, self.id, self.path, progress=self.progress,
+                url=self.url, in_place=True
+            )
+        except Exception as e:
+            self.error = e
+        with active_lock:
+            active.pop(self.path, None)
+        with self.written:
+            self.finished.set()
+            self.written.notify_all()
+        for callback in self.callbacks:
+            callback(self)
+
+    def progress(self, size, length):
+        """Wake up anyone waiting for data, then keep to the rate limit."""
+        with self.written:
+            self.size = size
+            self.written.notify_all()
+        rate = self.rate
+        if rate:
+            ahead = size / rate - (time() - self.started)
+            if ahead > 0:
+                sleep(min(ahead, 1))  # Recheck the limit every second.
+
+    def wait(self, size, timeout=None):
+        """
+        Block until some of the song has been downloaded.
+
+        Arguments:
+        size: Number of bytes to wait for.
+
+        Keyword arguments:
+        timeout=None: Max number of seconds to wait.
+
+        Returns: Whether or not the data is there.
+        """
+        with self.written:
+            self.written.wait_for(
+                lambda: self.size >= size or self.finished.is_set(),
+                timeout
+            )
+        return self.error is None and (
+            self.size >= size or self.finished.is_set()
+        )
+
+    @property
+    def playable_path(self):
+        """A path that mpv can play, even if the song is incomplete."""
+        if self.finished.is_set():
+            return self.path
+        # mpv's appending:// protocol keeps reading as the file grows.
+        return 'appending://%s' % self.path
+
+
+def valid(path):
+    """
+    Check whether a file is a readable mp3.
+
+    Arguments:
+    path: Location of the file.
+
+    Returns: Whether or not the file exists and has a length.
+    """
+    from mutagen.mp3 import MP3  # Slow to import, so wait.
+
+    if not isfile(path):
+        return False
+    try:
+        return MP3(path).info.length > 0
+    except Exception:  # Mutagen raises all sorts of things.
+        return False
+
+
+def format_time(s):
+    """
+    Format a duration for progress messages.
+
+    Arguments:
+    s: Number of seconds.
+
+    Returns: The duration in h:mm:ss.
+    """
+    s = int(s)
+    return '%d:%s:%s' % (s // 3600, str(s // 60 % 60).zfill(2),
+                         str(s % 60).zfill(2))
+
+
+class Manifest():
+    """
+    A record of completed downloads, kept next to the songs themselves.
+      Entries are appended one line at a time, so the file survives
+      being interrupted at any point.
+    """
+
+    def __init__(self, path):
+        """
+        Load (or create) a manifest.
+
+        Arguments:
+        path: Location of the manifest file.
+        """
+        self.path = path
+        self.entries = {}  # Song id -> {'file': path, 'size': bytes}.
+        self.lock = Lock()
+        if isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['id']] = entry
+                    except (ValueError, KeyError):  # Torn final line.
+                        continue
+
+    def done(self, id, path):
+        """
+        Check whether a song has already been downloaded intact.
+
+        Arguments:
+        id: Id of the song.
+        path: Where the song should be.
+
+        Returns: Whether or not the file exists with the recorded size.
+        """
+        entry = self.entries.get(id)
+        return (
+            entry is not None and isfile(path) and
+            getsize(path) == entry['size']
+        )
+
+    def add(self, id, path, size):
+        """
+        Record a completed download.
+
+        Arguments:
+        id: Id of the song.
+        path: Where the song was saved.
+        size: Size of the file in bytes.
+        """
+        entry = {'id': id, 'file': path, 'size': size}
+        with self.lock:
+            self.entries[id] = entry
+            with open(self.path, 'a') as f:
+                f.write('%s\n' % json.dumps(entry))
+
+
+class BulkDownloader():
+    """Download many library songs at once with a pool of workers."""
+
+    def __init__(self, login, jobs=4):
+        """
+        BulkDownloader constructor.
+
+        Arguments:
+        login: Function returning a new logged in Musicmanager.
+          Each worker gets its own.
+
+        Keyword arguments:
+        jobs=4: Number of songs to download at the same time.
+        """
+        self.login = login
+        self.jobs = jobs
+        self.local = local()
+        self.manifest = Manifest(
+            join(common.DATA_DIR, 'songs', '.manifest')
+        )
+
+    def mm(self):
+        """Get the current worker's Musicmanager."""
+        if not hasattr(self.local, 'mm'):
+            self.local.mm = self.login()
+        return self.local.mm
+
+    def download(self, id, path, also=()):
+        """
+        Download one song and record it in the manifest.
+
+        Arguments:
+        id: Id of the song to download.
+        path: Where to save the song.
+
+        Keyword arguments:
+        also=(): Ids of other songs which are saved to the same path,
+          to record against the file as well.
+
+        Returns: The number of bytes written.
+        """
+        size = fetch(self.mm(), id, path)
+        for song_id in (id,) + tuple(also):
+            self.manifest.add(song_id, path, size)
+        return size
+
+    def run(self, songs):
+        """
+        Download songs, skipping any which are already done.
+
+        Arguments:
+        songs: Dict of song id -> (title, artist, album).
+
+        Returns: The number of songs which failed to download.
+        """
+        todo = {}  # Path -> id of the song to download there.
+        # Songs with the same title, artist, and album share a path, so
+        # only one of them is downloaded, and the rest are recorded
+        # against its file. Otherwise they'd write the same .part file.
+        dupes = {}  # Id being downloaded -> other ids with its path.
+        for id, fields in songs.items():
+            path = song_path(*fields)
+            if self.manifest.done(id, path):
+                continue
+            if path in todo:
+                dupes.setdefault(todo[path], []).append(id)
+            elif valid(path):  # Downloaded some other way, i.e. by playing.
+                self.manifest.add(id, path, getsize(path))
+            else:
+                todo[path] = id
+        pending = len(todo) + sum(len(ids) for ids in dupes.values())
+        print('%d of %d songs already downloaded.' %
+              (len(songs) - pending, len(songs)))
+
+        failed = 0
+        total_bytes, start = 0, time()
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = {
+                pool.submit(self.download, id, path, dupes.get(id, ())): id
+                for path, id in todo.items()
+            }
+            try:
+                for i, future in enumerate(as_completed(futures)):
+                    fields = songs[futures[future]]
+                    try:
+                        total_bytes += future.result()
+                    except Exception as e:
+                        failed += 1
+                        print('Failed: %s (%s)' % (' - '.join(fields), e))
+                        continue
+
+                    elapsed = max(time() - start, 0.001)
+                    eta = elapsed / (i + 1) * (len(todo) - i - 1)
+                    print('%d/%d: %s (%.2f MB/s, ETA %s)' % (
+                        i + 1, len(todo), ' - '.join(fields),
+                        total_bytes / elapsed / 1000000, format_time(eta),
+                    ))
+            except KeyboardInterrupt:
+                # Let the running downloads finish, but don't start any more.
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return failed
@@ -0,0 +1,223 @@
+from array import array
+from heapq import nsmallest
+from threading import RLock
+
+
+class SearchIndex():
+    """
+    An inverted index over library songs' name, artist, and album fields.
+      Whole words and every substring of up to three characters are
+      indexed, so a query only ever looks at songs that can possibly
+      match it.
+    """
+
+    def __init__(self):
+        """Create an empty SearchIndex."""
+        self.lock = RLock()
+        self.reset()
+
+    def reset(self):
+        """Remove every song from the index."""
+        self.tokens = {}  # Whole word -> array of document numbers.
+        self.short = {}  # 1 or 2 character substring -> doc numbers.
+        self.grams = {}  # 3 character substring -> array of doc numbers.
+        self.docs = []  # Doc number -> lowercased (name, artist, album).
+        self.ids = []  # Doc number -> song id.
+        self.numbers = {}  # Song id -> doc number.
+
+    def __len__(self):
+        """Return the number of indexed songs."""
+        return len(self.numbers)
+
+    def __contains__(self, id):
+        """Return whether or not a song id is indexed."""
+        return id in self.numbers
+
+    @staticmethod
+    def trigrams(string):
+        """
+        Split a string into all of its 3 character substrings.
+
+        Arguments:
+        string: String to be split.
+
+        Returns: A set of substrings.
+        """
+        return {string[i:i + 3] for i in range(len(string) - 2)}
+
+    @staticmethod
+    def substrings(string):
+        """
+        Get all of a string's 1 and 2 character substrings, for queries
+          too short to have trigrams.
+
+        Arguments:
+        string: String to be split.
+
+        Returns: A set of substrings.
+        """
+        return set(string) | {string[i:i + 2] for i in range(len(string) - 1)}
+
+    def add(self, id, name, artist, album):
+        """
+        Index a song, replacing any existing entry with the same id.
+
+        Arguments:
+        id: Unique song id.
+        name/artist/album: The song's searchable fields.
+        """
+        with self.lock:
+            self.remove(id)
+            doc = tuple(s.lower() for s in (name, artist, album))
+            n = len(self.docs)
+            self.docs.append(doc)
+            self.ids.append(id)
+            self.numbers[id] = n
+            # Fields are joined by a character which can't be searched for,
+            # so n-grams spanning two fields are harmless.
+            text = '\n'.join(doc)
+            SearchIndex.post(self.tokens, set(text.split()), n)
+            SearchIndex.post(self.short, SearchIndex.substrings(text), n)
+            SearchIndex.post(self.grams, SearchIndex.trigrams(text), n)
+
+    @staticmethod
+    def post(postings, keys, n):
+        """
+        Add a document number to the posting list of each key.
+
+        Arguments:
+        postings: Dict of posting lists.
+        keys: Keys under which to post the document.
+        n: Document number.
+        """
+        for key in keys:
+            ids = postings.get(key)
+            if ids is None:
+                postings[key] = array('I', (n,))
+            else:
+                ids.append(n)
+
+    def remove(self, id):
+        """
+        Remove a song from the index. Unknown ids are ignored.
+          Postings are cleaned up lazily, the next time the index
+          is compacted.
+
+        Arguments:
+        id: Unique song id.
+        """
+        with self.lock:
+            n = self.numbers.pop(id, None)
+            if n is None:
+                return
+            self.docs[n] = None
+            self.ids[n] = None
+            # Rebuild once more than half of the documents are dead.
+            if len(self.docs) > 2 * len(self.numbers) + 1024:
+                self.compact()
+
+    def compact(self):
+        """Rebuild the index without any removed songs."""
+        with self.lock:
+            live = [
+                (id, doc) for id, doc in zip(self.ids, self.docs)
+                if id is not None
+            ]
+            self.reset()
+            for id, doc in live:
+                self.add(id, *doc)
+
+    def candidates(self, query):
+        """
+        Find the documents which could contain a query.
+
+        Arguments:
+        query: Lowercased search query.
+
+        Returns: The shortest posting list that every match must be in.
+        """
+        if len(query) < 3:  # No trigrams, so look it up whole.
+            return self.short.get(query, ())
+        return min(
+            (self.grams.get(g, ()) for g in SearchIndex.trigrams(query)),
+            key=len
+        )
+
+    def rank(self, n, query):
+        """
+        Score how well a document matches a query. Lower is better.
+
+        Arguments:
+        n: Document number.
+        query: Lowercased search query.
+
+        Returns: A sortable score, or None if the document doesn't match.
+        """
+        doc = self.docs[n]
+        if doc is None:  # Removed.
+            return None
+        best = None
+        # A hit on the name beats a hit on the artist, which beats a hit
+        # on the album. Ties go to whichever song was indexed first.
+        for i, field in enumerate(doc):
+            if query not in field:
+                continue
+            # Every occurrence counts, not just the first.
+            if field == query:
+                quality = 0  # Whole field.
+            elif query in field.split():
+                quality = 1  # Whole word.
+            elif field.startswith(query) or ' ' + query in field:
+                quality = 2  # Start of a word.
+            else:
+                quality = 3  # Anywhere else.
+            score = (quality, i, n)
+            if best is None or score < best:
+                best = score
+        return best
+
+    def search(self, query, limit=-1):
+        """
+        Search the index for songs containing some query.
+
+        Arguments:
+        query: The search query. Search is case-insensitive.
+
+        Keyword arguments:
+        limit=-1: Max number of results to return. -1 indicates no limit.
+
+        Returns: A list of song ids, best matches first.
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+
+        with self.lock:
+            scored = []
+            # Whole-word matches always outrank partial ones, so if there
+            # are enough of them we needn't look at anything else.
+            words = self.tokens.get(query, ())
+            if limit != -1 and len(words) >= limit:
+                scored = self.score(words, query)
+            if len(scored) < limit or limit == -1:
+                scored = self.score(self.candidates(query), query)
+
+            if limit == -1:
+                scored.sort()
+            else:
+                scored = nsmallest(limit, scored)
+
+            return [self.ids[score[2]] for score in scored]
+
+    def score(self, postings, query):
+        """
+        Rank every matching document in a posting list.
+
+        Arguments:
+        postings: Document numbers to check.
+        query: Lowercased search query.
+
+        Returns: A list of scores for the documents that match.
+        """
+        scores = (self.rank(n, query) for n in postings)
+        return [score for score in scores if score is not None]
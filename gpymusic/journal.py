@@ -0,0 +1,172 @@
+from . import music_objects
+
+from collections import deque
+from os import fsync, replace
+from os.path import isfile
+
+import json
+
+
+class Journal():
+    """
+    An append-only record of changes to the queue, so that it survives a
+      crash. Each change is one line of JSON, written as it happens, and
+      the file is rewritten as a single snapshot once enough changes
+      have piled up. Songs are stored as they are in playlist files, so
+      restoring them doesn't need the api.
+    """
+
+    def __init__(self, path, compact_after=1000):
+        """
+        Journal constructor. Nothing is read or written until replay().
+
+        Arguments:
+        path: File to keep the journal in.
+
+        Keyword arguments:
+        compact_after=1000: Min number of changes to write before
+          compacting the journal.
+        """
+        self.path = path
+        self.compact_after = compact_after
+        self.f = None
+        self.changes = 0  # Changes written since the last snapshot.
+        self.current = None  # Song which last started playing.
+        # Songs taken off to be played which haven't started yet. The
+        # player loads each song well before the one before it ends.
+        self.taken = deque()
+
+    def replay(self):
+        """
+        Read the journal back, and start writing to it.
+
+        Returns: A list of the queue's songs, starting with the one that was
+          playing when the journal was last written to, if any, and then
+          any that were taken off to be played after it.
+        """
+        songs, current, taken = deque(), None, deque()
+        if isfile(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        op, *args = json.loads(line)
+                    except ValueError:  # Cut off by a crash.
+                        break
+                    if op == 'reset':
+                        songs, current = deque(args[0]), args[1]
+                        taken = deque(args[2] if len(args) > 2 else ())
+                    elif op == 'add':
+                        songs.extend(args[0])
+                    elif op == 'front':
+                        songs.extendleft(reversed(args[0]))
+                        current, taken = None, deque()
+                    elif op == 'advance':
+                        if songs:
+                            taken.append(songs.popleft())
+                    elif op == 'remove':
+                        del songs[args[0]]
+                    elif op == 'move':
+                        song = songs[args[0]]
+                        del songs[args[0]]
+                        songs.insert(args[1], song)
+                    elif op == 'start':
+                        current = args[0]
+                        Journal.start(taken, current)
+
+        songs.extendleft(reversed(taken))
+        if current is not None:
+            songs.appendleft(current)
+        restored = [
+            music_objects.mapping[song['kind'] + 's']['cls'](
+                song, source='json'
+            ) for song in songs if music_objects.Song.verify(song)
+        ]
+        self.compact(restored)
+        return restored
+
+    def write(self, op, *args):
+        """
+        Record a change to the queue.
+
+        Arguments:
+        op: Name of the change, i.e. 'add'.
+        args: Its arguments. Lists of songs are written out in full.
+        """
+        if op == 'advance':
+            self.taken.append(args[0])
+            args = ()
+        elif op == 'start':
+            self.current = args[0]
+            Journal.start(self.taken, self.current)
+        elif op == 'front':
+            self.current, self.taken = None, deque()
+        if self.f is None:
+            return
+        try:
+            json.dump(
+                [op] + list(args), self.f,
+                default=music_objects.MusicObject.to_dict
+            )
+            self.f.write('\n')
+            self.f.flush()
+        except (OSError, ValueError):  # Not worth crashing over.
+            return
+        self.changes += 1
+
+    @staticmethod
+    def start(taken, song):
+        """
+        Take a song which has started playing out of the songs waiting to
+          start. Any taken before it were skipped, so they go too.
+
+        Arguments:
+        taken: Deque of songs waiting to start.
+        song: The song which started.
+        """
+        ids = [s['id'] for s in taken]
+        if song['id'] in ids:
+            for i in range(ids.index(song['id']) + 1):
+                taken.popleft()
+
+    def due(self, size):
+        """
+        Check whether the journal should be compacted.
+
+        Arguments:
+        size: Number of songs in the queue.
+
+        Returns: Whether or not it has grown well beyond a snapshot's size.
+        """
+        return self.changes > max(self.compact_after, 2 * size)
+
+    def compact(self, songs, current=False):
+        """
+        Replace the journal with a snapshot of the queue.
+
+        Arguments:
+        songs: The queue's songs.
+
+        Keyword arguments:
+        current=False: Song being played, or False to leave it as it is.
+          Songs waiting to start are forgotten along with it.
+        """
+        if current is not False:
+            self.current, self.taken = current, deque()
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        tmp_path = '%s.tmp' % self.path
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(
+                    ['reset', list(songs), self.current, list(self.taken)], f,
+                    default=music_objects.MusicObject.to_dict
+                )
+                f.write('\n')
+                f.flush()
+                fsync(f.fileno())
+            replace(tmp_path, self.path)
+            self.f = open(self.path, 'a')
+        except OSError:  # Carry on without a journal.
+            return
+        self.changes = 0
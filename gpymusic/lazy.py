@@ -0,0 +1,52 @@
+from importlib import import_module
+from threading import Lock
+
+
+class Lazy():
+    """
+    Stands in for an object from a module that's slow to import, i.e. a
+      gmusicapi client. The module is only imported, and the object
+      created, when one of the object's attributes is first used.
+    """
+
+    def __init__(self, module, name):
+        """
+        Lazy constructor.
+
+        Arguments:
+        module: Name of the module to import, i.e. 'gmusicapi'.
+        name: Name of the class in it to create, with no arguments.
+        """
+        # Underscores keep these from hiding the real object's attributes.
+        self._module = module
+        self._name = name
+        self._target = None
+        self._lock = Lock()
+
+    def _load(self):
+        """
+        Create the real object, if it hasn't been already.
+
+        Returns: The real object.
+        """
+        with self._lock:
+            if self._target is None:
+                cls = getattr(import_module(self._module), self._name)
+                self._target = cls()
+            return self._target
+
+    def __getattr__(self, attr):
+        """Get an attribute of the real object, creating it if necessary."""
+        return getattr(self._load(), attr)
+
+
+def loaded(obj):
+    """
+    Check whether a Lazy object has been created yet.
+
+    Arguments:
+    obj: A Lazy, or any other object.
+
+    Returns: False if obj is a Lazy which hasn't been used, else True.
+    """
+    return not isinstance(obj, Lazy) or obj._target is not None
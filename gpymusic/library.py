@@ -0,0 +1,241 @@
+from . import music_objects
+
+from threading import RLock
+from time import time
+
+import hashlib
+import json
+import sqlite3
+import zipfile
+
+
+class Library():
+    """
+    A user's uploaded and purchased songs, stored on disk in SQLite.
+      Opening a library doesn't read any songs: rows are only turned into
+      LibrarySongs when they're asked for.
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) a library.
+
+        Arguments:
+        path: Location of the library database.
+        """
+        # The library is shared with background threads, so we serialize
+        # access ourselves instead of tying the connection to one thread.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = RLock()
+        self.songs = {}  # Song id -> LibrarySong, once built.
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS songs ('
+                'id TEXT PRIMARY KEY, name TEXT, artist TEXT, album TEXT, '
+                'fingerprint TEXT)'
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)'
+            )
+            columns = [
+                row[1] for row in self.db.execute('PRAGMA table_info(songs)')
+            ]
+            if 'fingerprint' not in columns:  # Library from before syncing.
+                self.db.execute(
+                    'ALTER TABLE songs ADD COLUMN fingerprint TEXT'
+                )
+
+    @staticmethod
+    def fingerprint(song):
+        """
+        Summarize a song's metadata so that changes can be detected.
+
+        Arguments:
+        song: Dict with a song's information from Musicmanager.
+
+        Returns: A short hex digest of the song's fields.
+        """
+        fields = (
+            'title', 'artist', 'album', 'album_artist', 'track_number',
+            'track_size', 'disc_number', 'total_disc_count',
+        )
+        data = '\0'.join(str(song.get(k, '')) for k in fields)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+    def fingerprints(self):
+        """
+        Get the fingerprint of every song in the library.
+
+        Returns: A dict of song id -> fingerprint.
+        """
+        with self.lock:
+            return dict(
+                self.db.execute('SELECT id, fingerprint FROM songs')
+            )
+
+    @property
+    def last_sync(self):
+        """Unix time of the last successful sync, or None."""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM meta WHERE key = ?', ('last_sync',)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def mark_synced(self):
+        """Record that the library is up to date as of now."""
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('last_sync', time())
+            )
+
+    def __len__(self):
+        """Return the number of songs in the library."""
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+
+    def __contains__(self, id):
+        """Return whether or not a song id is in the library."""
+        with self.lock:
+            return self.db.execute(
+                'SELECT 1 FROM songs WHERE id = ?', (id,)
+            ).fetchone() is not None
+
+    def rows(self, size=1000):
+        """
+        Iterate over the library's raw rows, a batch at a time.
+
+        Keyword arguments:
+        size=1000: Number of rows to read at once.
+
+        Returns: A generator of (id, name, artist, album) tuples.
+        """
+        with self.lock:
+            cursor = self.db.execute(
+                'SELECT id, name, artist, album FROM songs ORDER BY rowid'
+            )
+            batch = cursor.fetchmany(size)
+        while batch:
+            yield from batch
+            with self.lock:
+                batch = cursor.fetchmany(size)
+
+    def search(self, query, limit=-1):
+        """
+        Search the library's songs for some query, without an index.
+          Slower than a SearchIndex and only case-insensitive for ASCII,
+          but it needs nothing read ahead of time.
+
+        Arguments:
+        query: The search query.
+
+        Keyword arguments:
+        limit=-1: Max number of results to return. -1 indicates no limit.
+
+        Returns: A list of song ids. Matches on the name come first, then
+          the artist, then the album.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        # '!' escapes wildcards in the query, so they match themselves.
+        for c in '!%_':
+            query = query.replace(c, '!' + c)
+        like = {'like': "LIKE ?1 ESCAPE '!'"}
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT id FROM songs WHERE name %(like)s OR '
+                'artist %(like)s OR album %(like)s '
+                'ORDER BY CASE WHEN name %(like)s THEN 0 '
+                'WHEN artist %(like)s THEN 1 ELSE 2 END, rowid '
+                'LIMIT ?2' % like, ('%%%s%%' % query, limit)
+            )]
+
+    def get(self, id):
+        """
+        Get a song from the library.
+
+        Arguments:
+        id: Unique song id.
+
+        Returns: The LibrarySong with the given id, or None if it isn't
+          in the library. The same object is returned every time.
+        """
+        with self.lock:
+            if id in self.songs:
+                return self.songs[id]
+            row = self.db.execute(
+                'SELECT id, name, artist, album FROM songs WHERE id = ?',
+                (id,)
+            ).fetchone()
+            if row is None:
+                return None
+            song = music_objects.LibrarySong(
+                dict(zip(('id', 'name', 'artist', 'album'), row)),
+                source='json'
+            )
+            self.songs[id] = song
+            return song
+
+    def upsert(self, songs, fingerprints=None):
+        """
+        Add songs to the library, replacing any with the same id.
+          All of the songs are written in a single transaction.
+
+        Arguments:
+        songs: Iterable of dicts with keys 'id', 'name', 'artist',
+          and 'album', i.e. LibrarySongs.
+
+        Keyword arguments:
+        fingerprints=None: Dict of song id -> fingerprint to store.
+        """
+        songs = list(songs)
+        fingerprints = fingerprints or {}
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO songs '
+                '(id, name, artist, album, fingerprint) '
+                'VALUES (?, ?, ?, ?, ?)',
+                ((s['id'], s['name'], s['artist'], s['album'],
+                  fingerprints.get(s['id'])) for s in songs)
+            )
+            for s in songs:  # Forget any stale copies.
+                self.songs.pop(s['id'], None)
+
+    def remove(self, ids):
+        """
+        Remove songs from the library. Unknown ids are ignored.
+
+        Arguments:
+        ids: Iterable of song ids.
+        """
+        ids = list(ids)
+        with self.lock, self.db:
+            self.db.executemany(
+                'DELETE FROM songs WHERE id = ?', ((id,) for id in ids)
+            )
+            for id in ids:
+                self.songs.pop(id, None)
+
+    def migrate(self, path):
+        """
+        Import songs from an old-style library.zip file.
+
+        Arguments:
+        path: Location of the library.zip file.
+
+        Returns: Whether or not the file could be read.
+        """
+        try:
+            with zipfile.ZipFile(path) as z:
+                lib = json.loads(z.read('library.json').decode('utf-8'))
+            self.upsert(lib['songs'])
+        except (zipfile.BadZipFile, KeyError, ValueError, TypeError):
+            return False
+        return True
+
+    def close(self):
+        """Close the library's database connection."""
+        with self.lock:
+            self.db.close()
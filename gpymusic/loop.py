@@ -0,0 +1,195 @@
+from . import common
+
+from collections import deque
+from queue import Queue
+from threading import Thread
+
+import curses as crs
+import os
+import selectors
+import sys
+
+
+# Keys which control playback while the prompt is empty.
+controls = {
+    ' ': lambda: common.player.pause(),
+    'n': lambda: common.player.skip(),
+    'x': lambda: common.player.stop(),
+    '9': lambda: common.player.volume(-2),
+    '0': lambda: common.player.volume(2),
+    crs.KEY_LEFT: lambda: common.player.seek(-5),
+    crs.KEY_RIGHT: lambda: common.player.seek(5),
+    crs.KEY_UP: lambda: common.player.seek(60),
+    crs.KEY_DOWN: lambda: common.player.seek(-60),
+}
+
+
+def page_down():
+    """Scroll down, and fetch more results once we reach the bottom."""
+    common.w.page(1)
+    if common.v.offset + common.w.ylimit >= len(common.v):
+        common.loop.submit(lambda: common.client.more())
+
+
+# Keys which scroll the main window at any time.
+scrolling = {
+    crs.KEY_NPAGE: page_down,
+    crs.KEY_PPAGE: lambda: common.w.page(-1),
+}
+
+
+class Worker():
+    """
+    A thread which runs functions one at a time, in the order they were
+      submitted. It's a daemon, so whatever it's running when we exit
+      (i.e. a slow login) doesn't keep us from exiting.
+    """
+
+    def __init__(self):
+        """Create a Worker and start its thread."""
+        self.jobs = Queue()
+        Thread(target=self.run, daemon=True).start()
+
+    def submit(self, job):
+        """
+        Run a function on the worker's thread.
+
+        Arguments:
+        job: Function to call, with no arguments.
+        """
+        self.jobs.put(job)
+
+    def run(self):
+        """Run jobs as they arrive, forever."""
+        while True:
+            self.jobs.get()()
+
+
+class EventLoop():
+    """
+    The main loop. It waits on the terminal and on other threads at the
+      same time, so typing, playback, and network requests never hold
+      each other up. Commands run one at a time on a worker thread, and
+      playback controls on another.
+    """
+
+    def __init__(self):
+        """Create an EventLoop. Nothing happens until run() is called."""
+        self.selector = selectors.DefaultSelector()
+        self.callbacks = deque()  # Functions to run on the loop thread.
+        self.commands = Worker()
+        # Playback controls wait on mpv, and skipping can wait on a
+        # download, so they get a worker of their own.
+        self.controls = Worker()
+        # Writing to this pipe wakes the loop up from another thread.
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.selector.register(
+            self.wake_r, selectors.EVENT_READ, self.drain_wakeups
+        )
+
+    def add_reader(self, fd, callback):
+        """
+        Call a function whenever a file descriptor is readable.
+
+        Arguments:
+        fd: File descriptor to watch.
+        callback: Function to call, with no arguments.
+        """
+        self.selector.register(fd, selectors.EVENT_READ, callback)
+
+    def call_soon(self, callback):
+        """
+        Run a function on the loop thread. Safe to call from any thread.
+
+        Arguments:
+        callback: Function to call, with no arguments.
+        """
+        self.callbacks.append(callback)
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:  # Already plenty of wakeups pending.
+            pass
+
+    def submit(self, command):
+        """
+        Run a command on the command thread. Commands run in the order
+          they were submitted, one at a time.
+
+        Arguments:
+        command: Function to call, with no arguments.
+        """
+        def run():
+            try:
+                command()
+            except Exception as e:
+                common.w.error_msg('Command failed (%s)' % e)
+        self.commands.submit(run)
+
+    def control(self, command):
+        """
+        Run a playback control on the controls thread. Controls run in
+          the order they were pressed, one at a time.
+
+        Arguments:
+        command: Function to call, with no arguments.
+        """
+        def run():
+            try:
+                command()
+            except Exception:  # mpv went away, nothing to control.
+                pass
+        self.controls.submit(run)
+
+    def drain_wakeups(self):
+        """Empty the wakeup pipe."""
+        try:
+            while os.read(self.wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def run_once(self):
+        """Wait for something to happen, and handle it."""
+        timeout = 0 if self.callbacks else None
+        for key, mask in self.selector.select(timeout):
+            key.data()
+
+        for i in range(len(self.callbacks)):  # Leave new ones for later.
+            self.callbacks.popleft()()
+
+    def run(self):
+        """Run until the user exits with Ctrl-C."""
+        while True:
+            try:
+                self.run_once()
+            except KeyboardInterrupt:
+                common.np.close()
+                common.w.goodbye('Goodbye, thanks for using Google Py Music!')
+
+
+def read_input():
+    """
+    Handle everything that's been typed. Playback controls take effect
+      right away, and finished lines are run as commands.
+    """
+    for key in common.w.read_keys():
+        if key in scrolling:
+            scrolling[key]()
+            continue
+        if key in controls and common.player.playing and not common.w.buffer:
+            common.loop.control(controls[key])
+            continue
+        line = common.w.edit(key)
+        if line is not None and line.strip():
+            common.loop.submit(
+                lambda line=line: common.client.transition(line)
+            )
+
+
+def main():
+    """Start handling input, and run the main loop."""
+    common.w.prompt()
+    common.loop.add_reader(sys.stdin.fileno(), read_input)
+    common.loop.run()
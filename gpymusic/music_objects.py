@@ -1,13 +1,33 @@
 from . import common
+from . import download
+from . import songqueue
 
-from mutagen.mp3 import MP3
 from os import remove
-from os.path import isfile, join
-from subprocess import call
+from os.path import isfile
+from sys import intern
+from threading import RLock
+from weakref import WeakValueDictionary
 
 
-class MusicObject(dict):
-    """A dict representing a song, artist, or album."""
+# Artists and albums by class name and id, so that songs share them.
+# Entries disappear once nothing refers to them.
+registry = WeakValueDictionary()
+registry_lock = RLock()
+
+
+class MusicObject():
+    """
+    A song, artist, or album. Fields are read and written like a dict's,
+      i.e. song['name'], but they're stored in slots to save memory.
+      Items from the api keep the dict they were created from, and
+      only build their lazy fields from it when they're first read.
+    """
+
+    __slots__ = ('id', 'name', 'kind', 'full', 'raw', '__weakref__')
+    # Every field, in the order they're written out.
+    fields = ('id', 'name', 'kind', 'full')
+    # Fields built on first access by the build_<field> methods.
+    lazy = ()
 
     def __init__(self, id, name, kind, full):
         """
@@ -21,65 +41,214 @@ class MusicObject(dict):
           All Songs are full, but in general only Artists and Albums
           generated from get_{artist|album}_info}() are full.
         """
-        self['id'] = id
-        self['name'] = name
-        self['kind'] = kind
-        self['full'] = full
+        self.id = id
+        # Artist and album names are repeated across many songs, so
+        # only keep one copy of each string.
+        self.name = intern(name)
+        self.kind = intern(kind)
+        self.full = full
+
+    @classmethod
+    def shared(cls, item, full=False, source='api'):
+        """
+        Get the one instance of an item, creating it if there isn't one
+          yet. Sharing instances means that once an item is filled, every
+          song which refers to it sees the filled version.
+
+        Arguments:
+        item: Dict with the item's information, as for the constructor.
+
+        Keyword arguments:
+        full=False: Whether or not the dict has all of the item's
+          information. A full dict upgrades an existing item in place.
+        source='api': The source of the argument dict.
+
+        Returns: The shared instance.
+        """
+        key = (cls.__name__, item[cls.id_keys[source]])
+        with registry_lock:
+            obj = registry.get(key)
+            if obj is None:
+                obj = registry[key] = cls(item, full=full, source=source)
+            elif full and not obj['full']:
+                obj.__init__(item, full=full, source=source)
+            return obj
+
+    def upgrade(self, data):
+        """
+        Fill the item in from the api, through shared() so that every
+          reference to it sees the full version.
+
+        Arguments:
+        data: Dict with all of the item's information from gmusicapi.
+        """
+        if type(self).shared(data, full=True) is not self:  # Not shared.
+            self.__init__(data, full=True)
+
+    def __getitem__(self, key):
+        """Get a field's value, building it if necessary."""
+        if key not in self.fields:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:  # A lazy field which hasn't been built.
+            val = getattr(self, 'build_%s' % key)()
+            setattr(self, key, val)
+            return val
+
+    def defer(self, raw):
+        """
+        Keep an api dict to build the lazy fields from later, forgetting
+          any which were built from an older one.
+
+        Arguments:
+        raw: Dict with the item's information from gmusicapi.
+        """
+        self.raw = raw
+        for key in self.lazy:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                pass
+
+    def __setitem__(self, key, val):
+        """Set a field's value."""
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, val)
+
+    def __contains__(self, key):
+        """Return whether or not the item has a field."""
+        return key in self.fields
+
+    def __repr__(self):
+        """Return the item's fields, like a dict's repr."""
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+    def keys(self):
+        """Return the item's field names."""
+        return self.fields
+
+    def get(self, key, default=None):
+        """Get a field's value, or default if there's no such field."""
+        return self[key] if key in self.fields else default
+
+    def to_dict(self):
+        """
+        Convert the item to the dict that we write to playlist files.
+          Items that it refers to, i.e. a song's album, are written as
+          stubs without their own songs, as they're looked up again
+          when needed.
+
+        Returns: A dict that can be serialized to JSON.
+        """
+        return {k: MusicObject.encode(self[k]) for k in self.fields}
+
+    def stub(self):
+        """
+        Convert the item to a minimal dict which can be read back in.
+
+        Returns: A dict that can be serialized to JSON.
+        """
+        d = {k: MusicObject.encode(self[k]) for k in self.fields}
+        d['full'] = False
+        return d
 
     @staticmethod
-    def play(songs, breakpoint=-1):
+    def encode(val):
         """
-        Play some songs.
+        Prepare a field's value for to_dict().
 
         Arguments:
-        songs: List of songs to play.
+        val: Field value.
+
+        Returns: val, with MusicObjects replaced by stubs and lists of
+          them emptied.
+        """
+        if isinstance(val, MusicObject):
+            return val.stub()
+        elif isinstance(val, list):
+            return []
+        return val
+
+    @staticmethod
+    def play(songs, breakpoint=-1, taken=None):
+        """
+        Start playing some songs back to back in mpv. Playback carries on
+          in the background, taking songs off the front of the list as
+          it goes, so the list can be added to while it plays.
+
+        Arguments:
+        songs: Queue of songs to play. Songs which never get started,
+          i.e. because playback was stopped, are put back at its front.
 
         Keyword arguments:
         breakpoint=-1: Max number of songs to play during testing.
+        taken=None: Function called each time a song is taken off the list.
 
-        Returns: None if all songs were played, or the index of the
-          first unplayed song to be used in restoring the queue.
+        Returns: Whether or not playback started.
         """
-        conf_path = join(common.CONFIG_DIR, 'mpv_input.conf')
-        if not isfile(conf_path):
-            common.w.goodbye('No mpv_input.conf found.')
-
-        common.v.replace({'songs': songs[:]})  # Need to make a deep copy.
+        common.v.replace(songs.collect())
         common.w.display()
-        i = 1
 
-        for song in songs:
+        played = [0]  # Songs taken off the list so far.
+        pending = []  # Songs handed to mpv which haven't started yet.
+        previous = [None]  # Song that was playing before this one.
+
+        def feed():
+            song = songs.advance() if played[0] != breakpoint else None
+            if song is None:
+                return None
+            if taken is not None:
+                taken()
+            # Get the next few songs ready while this one plays.
+            common.pf.schedule(songs.peek(common.pf.depth))
             try:
-                url = common.mc.get_stream_url(song['id'])
-            except:  # Not sure exactly what exception is raised.
-                common.w.goodbye(
-                    'Access denied: Is your device ID set correctly?'
-                )
-
+                source = song.source()
+            except Exception as e:
+                if played[0]:  # The player moves on to the next song.
+                    common.w.error_msg('Skipped %s (%s)' % (song, e))
+                else:  # Nothing has played, so keep it for next time.
+                    songs.requeue([song])
+                raise
+            played[0] += 1
+            pending.append(song)
+            return source, song
+
+        def started(song):
+            pending.remove(song)
+            songs.started(song)
+            view = common.v['songs'] if 'songs' in common.v else []
+            if previous[0] is not None and view and view[0] is previous[0]:
+                view.pop(0)  # Remove songs from sight after they're played.
+                common.w.display()
+            previous[0] = song
+            i = played[0] - len(pending)
             common.w.now_playing(
                 '(%d/%d) %s (%s)' %
-                (i, len(songs), str(song), song['time'])
+                (i, i + len(pending) + len(songs), str(song), song['time'])
             )
 
-            try:
-                ret = call(
-                    ['mpv', '--really-quiet', '--input-conf', conf_path, url]
-                )
-            except KeyboardInterrupt:
-                ret = 11
-
-            if ret == 11:  # 'q' returns this exit code.
-                return i
-
-            i += 1
-            common.v['songs'].pop(0)
-            common.w.display()  # Remove songs from sight after they're played.
+        def finished(stopped, unstarted):
+            songs.requeue(unstarted)
+            common.w.now_playing()
+            common.w.erase_outbar()
 
-        return i
+        try:
+            return common.player.play(feed, started=started, finished=finished)
+        except Exception as e:  # i.e. mpv, or the first song's download.
+            songs.requeue(pending)
+            common.w.error_msg('Playback failed (%s)' % e)
+            return False
 
 
 class Artist(MusicObject):
-    """A dict representing an artist."""
+    """An artist, with some of their songs and albums."""
+
+    __slots__ = ('songs', 'albums')
+    fields = MusicObject.fields + __slots__
+    lazy = __slots__
+    id_keys = {'api': 'artistId', 'json': 'id'}  # Id field by source.
 
     def __init__(self, artist, full=False, source='api'):
         """
@@ -95,14 +264,7 @@ class Artist(MusicObject):
         """
         if source == 'api':
             super().__init__(artist['artistId'], artist['name'], 'artist', full)  # noqa
-            try:
-                self['songs'] = [Song(s) for s in artist['topTracks']]
-            except KeyError:
-                self['songs'] = []
-            try:
-                self['albums'] = [Album(a) for a in artist['albums']]
-            except KeyError:
-                self['albums'] = []
+            self.defer(artist)
 
         elif source == 'json':
             super().__init__(artist['id'], artist['name'], 'artist', full)
@@ -110,9 +272,18 @@ class Artist(MusicObject):
                 Song(song, source='json') for song in artist['songs']
             ]
             self['albums'] = [
-                Album(album, source='json') for album in artist['albums']
+                Album.shared(album, source='json')
+                for album in artist['albums']
             ]
 
+    def build_songs(self):
+        """Returns: The artist's top tracks from the raw dict."""
+        return [Song(s) for s in self.raw.get('topTracks', [])]
+
+    def build_albums(self):
+        """Returns: The artist's albums from the raw dict."""
+        return [Album.shared(a) for a in self.raw.get('albums', [])]
+
     @staticmethod
     def verify(item):
         """
@@ -140,7 +311,7 @@ class Artist(MusicObject):
         """Play an artist's song list."""
         if not self['full']:
             self.fill(mapping['artists']['lookup'])
-        MusicObject.play(self['songs'])
+        MusicObject.play(songqueue.Queue(self['songs']))
 
     def collect(self, limit=20):
         """
@@ -172,14 +343,16 @@ class Artist(MusicObject):
         if self['full']:
             return
 
-        data = func(self['id'], max_top_tracks=limit)
-        self['songs'] = [Song(song) for song in data['topTracks']]
-        self['albums'] = [Album(album) for album in data['albums']]
-        self['full'] = True
+        self.upgrade(func(self['id'], max_top_tracks=limit))
 
 
 class Album(MusicObject):
-    """A dict representing an album."""
+    """An album and its songs."""
+
+    __slots__ = ('artist', 'songs')
+    fields = MusicObject.fields + __slots__
+    lazy = __slots__
+    id_keys = {'api': 'albumId', 'json': 'id'}  # Id field by source.
 
     def __init__(self, album, full=False, source='api'):
         """
@@ -195,21 +368,25 @@ class Album(MusicObject):
         """
         if source == 'api':
             super().__init__(album['albumId'], album['name'], 'album', full)
-            self['artist'] = Artist({
-                'artistId': album['artistId'][0], 'name': album['artist']
-            })
-            try:
-                self['songs'] = [Song(s) for s in album['tracks']]
-            except KeyError:
-                self['songs'] = []
+            self.defer(album)
 
         elif source == 'json':
             super().__init__(album['id'], album['name'], 'album', full)
-            self['artist'] = Artist(album['artist'], source='json')
+            self['artist'] = Artist.shared(album['artist'], source='json')
             self['songs'] = [
                 Song(song, source='json') for song in album['songs']
             ]
 
+    def build_artist(self):
+        """Returns: The album's artist from the raw dict."""
+        return Artist.shared({
+            'artistId': self.raw['artistId'][0], 'name': self.raw['artist']
+        })
+
+    def build_songs(self):
+        """Returns: The album's tracks from the raw dict."""
+        return [Song(s) for s in self.raw.get('tracks', [])]
+
     @staticmethod
     def verify(item):
         """
@@ -234,7 +411,7 @@ class Album(MusicObject):
         """Play an album's song list."""
         if not self['full']:
             self.fill(mapping['albums']['lookup'])
-        MusicObject.play(self['songs'])
+        MusicObject.play(songqueue.Queue(self['songs']))
 
     def collect(self, limit=20):
         """
@@ -267,14 +444,15 @@ class Album(MusicObject):
         if self['full']:
             return
 
-        self['songs'] = [
-            Song(song) for song in func(self['id'])['tracks']
-        ]
-        self['full'] = True
+        self.upgrade(func(self['id']))
 
 
 class Song(MusicObject):
-    """A dict representing a song."""
+    """A song from the Google Play Music store."""
+
+    __slots__ = ('artist', 'album', 'time')
+    fields = MusicObject.fields + __slots__
+    lazy = __slots__
 
     def __init__(self, song, full=True, source='api'):
         """
@@ -293,26 +471,36 @@ class Song(MusicObject):
                 super().__init__(song['storeId'], song['title'], 'song', full)
             else:  # Case of uploaded song and an All-Access subsriber.
                 super().__init__(song['id'], song['title'], 'song', full)
-            try:
-                self['artist'] = Artist({
-                    'name': song['artist'], 'artistId': song['artistId'][0]
-                })
-            except TypeError:
-                self['artist'] = Artist({
-                    'name': song['artist'], 'artistId': song['artistId']
-                })
-            self['album'] = Album({
-                'name': song['album'], 'albumId': song['albumId'],
-                'artist': song['artist'], 'artistId': song['artistId'],
-            })
-            self['time'] = Song.time_from_ms(song['durationMillis'])
+            self.defer(song)
 
         elif source == 'json':  # Initializing from JSON.
             super().__init__(song['id'], song['name'], 'song', full)
-            self['artist'] = Artist(song['artist'], source='json')
-            self['album'] = Album(song['album'], source='json')
+            self['artist'] = Artist.shared(song['artist'], source='json')
+            self['album'] = Album.shared(song['album'], source='json')
             self['time'] = song['time']
 
+    def build_artist(self):
+        """Returns: The song's artist from the raw dict."""
+        try:
+            return Artist.shared({
+                'name': self.raw['artist'], 'artistId': self.raw['artistId'][0]
+            })
+        except TypeError:
+            return Artist.shared({
+                'name': self.raw['artist'], 'artistId': self.raw['artistId']
+            })
+
+    def build_album(self):
+        """Returns: The song's album from the raw dict."""
+        return Album.shared({
+            'name': self.raw['album'], 'albumId': self.raw['albumId'],
+            'artist': self.raw['artist'], 'artistId': self.raw['artistId'],
+        })
+
+    def build_time(self):
+        """Returns: The song's formatted length from the raw dict."""
+        return Song.time_from_ms(self.raw['durationMillis'])
+
     @staticmethod
     def verify(item):
         """
@@ -353,7 +541,49 @@ class Song(MusicObject):
 
     def play(self):
         """Play a song."""
-        MusicObject.play([self])
+        MusicObject.play(songqueue.Queue([self]))
+
+    def source(self):
+        """
+        Get something for mpv to play. The song is saved to the audio
+          cache as it streams, so songs we've played before are played
+          from disk.
+
+        Returns: The path to the song if it's cached, or else the part of
+          it downloaded so far, or its stream url.
+
+        Raises: IOError if we can't get a stream url.
+        """
+        cached = common.ac.get(self['id'])
+        if cached is not None:
+            return cached
+        try:
+            url = common.pf.url(self)
+        except Exception as e:  # Not sure exactly what exception is raised.
+            # This runs while the song before it plays, so let playback
+            # skip it rather than exiting.
+            raise IOError(
+                'No stream url: is your device ID set correctly? (%s)' % e
+            )
+        if not common.ac.quota:
+            return url
+        dl = download.start(
+            None, self['id'], common.ac.staging(self['id']),
+            callback=self.cache, url=url
+        )
+        if not dl.wait(download.BUFFER_SIZE):
+            return url  # Couldn't save it, so just stream it.
+        return dl.playable_path
+
+    def cache(self, dl):
+        """
+        Add the song to the audio cache once it's been downloaded.
+
+        Arguments:
+        dl: The finished Download.
+        """
+        if dl.error is None:
+            common.ac.add(self['id'], dl.path)
 
     def collect(self, limit=None):
         """
@@ -386,6 +616,9 @@ class Song(MusicObject):
 class LibrarySong(MusicObject):
     """An uploaded or purchased song from a user's library."""
 
+    __slots__ = ('artist', 'album', 'time')
+    fields = MusicObject.fields + __slots__
+
     def __init__(self, song, source='api'):
         """
         Create a new LibrarySong.
@@ -402,8 +635,9 @@ class LibrarySong(MusicObject):
             song['title' if source == 'api' else 'name'],
             'libsong', False
         )
-        self['artist'] = song['artist']
-        self['album'] = song['album']
+        # Many songs share these, so only keep one copy of each.
+        self['artist'] = intern(song['artist'])
+        self['album'] = intern(song['album'])
         # Getting the song length would require us to make an api
         # call, so we'll leave that until we want to play it.
         self['time'] = ''
@@ -430,30 +664,50 @@ class LibrarySong(MusicObject):
         """
         return ' - '.join((self['name'], self['artist'], self['album']))
 
-    def play(self):
+    def path(self, played=False):
         """
-        Play the song.
+        Get the location of the song once it's downloaded: where
+          gpymusic-download-all put it, or else the audio cache.
+
+        Keyword arguments:
+        played=False: Whether or not the song is about to be played, so
+          that playing it from the audio cache counts as using it.
 
-        Returns: mpv's exit code (0 for next, 11 for stop).
+        Returns: The path to the song's mp3 file.
         """
-        file_path = join(
-            common.DATA_DIR, 'songs', '%s.mp3' % str(self).replace('/', '---')
-        )
-        conf_path = join(common.CONFIG_DIR, 'mpv_input.conf')
+        path = download.song_path(self['name'], self['artist'], self['album'])
+        if isfile(path):
+            return path
+        lookup = common.ac.get if played else common.ac.find
+        cached = lookup(self['id'])
+        return cached if cached is not None else common.ac.staging(self['id'])
 
-        try:
-            ret = call(
-                ['mpv', '--really-quiet', '--no-video',
-                 '--input-conf', conf_path, file_path]
-            )
-        except KeyboardInterrupt:
-            ret = 11
+    def play(self):
+        """Play the song."""
+        MusicObject.play(songqueue.Queue([self]))
 
-        return ret
+    def source(self):
+        """
+        Get something for mpv to play, downloading the song if needed.
+          If it's still downloading, we play what's there so far.
+
+        Returns: The path to the song. It stays valid after the download
+          finishes, as mpv might not open it until the song before it ends.
+
+        Raises: The exception which stopped the download, if it failed.
+        """
+        dl = self.download()
+        if dl is None:
+            return self.path(played=True)
+        if dl.error is not None:  # There's nothing to play.
+            raise dl.error
+        return dl.playable_path
 
     def fill(self, func, limit=0):
         """
-        Download the song, and fill in its length field.
+        Start downloading the song, and wait until there's enough of it
+          to start playing. Its length field is filled in once the
+          download is finished.
 
         Arguments:
         func: Irrelevant.
@@ -461,56 +715,114 @@ class LibrarySong(MusicObject):
         Keyword arguments:
         limit=0: Irrelevant.
         """
-        # Can't have '/' in filenames so replace with them with something
-        # that will (hopefully) never occur naturally.
-        dl_path = join(
-            common.DATA_DIR, 'songs', '%s.mp3' % str(self).replace('/', '---')
-        )
-        dl = False
-        if not isfile(dl_path):
-            common.w.outbar_msg('Downloading %s...' % str(self))
-            with open(dl_path, 'wb') as f:
-                f.write(common.client.mm.download_song(self['id'])[1])
-            self['full'] = True
-            dl = True
+        self.download()
+
+    def download(self):
+        """
+        Start downloading the song unless it's already on disk or being
+          downloaded, and wait until there's enough of it to play.
+
+        Returns: The Download, or None if the song was already on disk.
+          If the download failed, its error is set.
+        """
+        staging = common.ac.staging(self['id'])
+        dl = download.active.get(staging)
+        if dl is None:
+            dl_path = self.path()
+            if isfile(dl_path):
+                if download.valid(dl_path):
+                    self.downloaded()
+                    return None
+                # File might be corrupt, so re-download it. Files in the
+                # audio cache can be shared, so it decides what to delete.
+                if dl_path == common.ac.find(self['id']):
+                    common.ac.discard(self['id'])
+                else:
+                    remove(dl_path)
+            dl = download.start(
+                common.client.mm, self['id'], staging,
+                callback=self.downloaded_callback()
+            )
+
+        common.w.outbar_msg('Downloading %s...' % str(self))
+        if not dl.wait(download.BUFFER_SIZE):
+            common.w.outbar_msg('Song could not be downloaded.')
+        return dl
+
+    def downloaded_callback(self):
+        """
+        Make a callback for download.start which fills in our length.
+
+        Returns: A function taking a Download.
+        """
+        return lambda dl: self.downloaded(dl.error, dl.path)
+
+    def downloaded(self, error=None, path=None):
+        """
+        Fill in the song's length once it's been downloaded.
+
+        Keyword arguments:
+        error=None: The exception which stopped the download, if any.
+        path=None: Where it was downloaded to, if it should be added to
+          the audio cache.
+        """
+        if error is not None:
+            return
+        if path is not None:
+            common.ac.add(self['id'], path)
         try:
-            self['time'] = LibrarySong.time_from_s(MP3(dl_path).info.length)
-        except:  # Todo: look into more specific mutagen errors.
-            remove(dl_path)
-            if not dl:  # File might be corrupt, so re-download it.
-                self.fill(None)
-            else:  # Otherwise we're out of luck.
-                common.w.outbar_msg('Song could not be downloaded.')
+            from mutagen.mp3 import MP3  # Slow to import, so wait.
+            self['time'] = LibrarySong.time_from_s(
+                MP3(self.path()).info.length
+            )
+            self['full'] = True
+        except Exception:  # Todo: look into more specific mutagen errors.
+            self['time'] = ''
 
 
 # Music object mapping:
 # cls: Class name of each type.
 # hits: Key in mc.search() results.
 # rslt_key: Key in an individual entry from mc.search()
-# lookup: method to retrieve object information
+# lookup: method to retrieve object information, which only touches
+#   common.mc when it's called, so that gmusicapi isn't imported until then
+# new: function to build an object from a search result
 mapping = {
     'songs': {
         'cls': Song,
         'hits': 'song_hits',
         'rslt_key': 'track',
-        'lookup': common.mc.get_track_info,
+        'lookup': common.mdc.wrap(
+            'songs',
+            lambda id, **kwargs: common.mc.get_track_info(id, **kwargs)
+        ),
+        'new': Song,
     },
     'artists': {
         'cls': Artist,
         'hits': 'artist_hits',
         'rslt_key': 'artist',
-        'lookup': common.mc.get_artist_info,
+        'lookup': common.mdc.wrap(
+            'artists',
+            lambda id, **kwargs: common.mc.get_artist_info(id, **kwargs)
+        ),
+        'new': Artist.shared,
     },
     'albums': {
         'cls': Album,
         'hits': 'album_hits',
         'rslt_key': 'album',
-        'lookup': common.mc.get_album_info,
+        'lookup': common.mdc.wrap(
+            'albums',
+            lambda id, **kwargs: common.mc.get_album_info(id, **kwargs)
+        ),
+        'new': Album.shared,
     },
     'libsongs': {
         'cls': LibrarySong,
         'hits': '',
         'rslt_key': '',
         'lookup': '',
+        'new': LibrarySong,
     },
 }
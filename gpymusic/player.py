@@ -0,0 +1,413 @@
+from collections import deque
+from itertools import count
+from os.path import join
+from queue import Empty, Queue
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event, Lock, RLock, Thread
+from time import sleep, time
+
+import atexit
+import json
+import socket
+import subprocess
+
+
+class PlayerError(Exception):
+    """Raised when mpv can't be started or rejects a command."""
+    pass
+
+
+class Session():
+    """One call to Player.play: a feed of songs and its callbacks."""
+
+    def __init__(self, feed, started, finished):
+        """
+        Session constructor.
+
+        Arguments:
+        feed/started/finished: See Player.play.
+        """
+        self.feed = feed
+        self.started = started
+        self.finished = finished
+        self.loaded = deque()  # Items handed to mpv which haven't started.
+        self.current = None  # Item playing now.
+        self.stopped = False
+
+    def next(self):
+        """
+        Get the next song from the feed.
+
+        Returns: A (source, item) tuple, or None.
+        """
+        try:
+            return self.feed()
+        except Exception:  # Couldn't get the song, so skip it.
+            return None
+
+    def end(self, stopped):
+        """
+        Let the owner know that playback is over.
+
+        Arguments:
+        stopped: Whether or not playback was cut short.
+        """
+        if self.finished is not None:
+            self.finished(stopped, list(self.loaded))
+
+
+class Player():
+    """
+    A single long-lived mpv process, driven over its JSON IPC socket.
+      Keeping one mpv around means there's no startup cost or silence
+      between songs, and lets it play them back to back. Playback runs
+      in the background, so callers never wait on a song.
+    """
+
+    # Seconds before the end of a song at which we load the next one.
+    # Stream urls expire, so we don't get them any earlier than this.
+    # mpv doesn't open the next song until the current one ends, so
+    # sources from the feed have to stay valid for at least this long.
+    preload = 15
+
+    def __init__(self, command=('mpv',)):
+        """
+        Player constructor. mpv isn't started until it's needed.
+
+        Keyword arguments:
+        command=('mpv',): Command to run mpv.
+        """
+        self.command_line = list(command)
+        self.process = None
+        self.sock = None
+        self.tmp_dir = None
+        self.ids = count()
+        self.responses = {}  # Request id -> [Event, response].
+        self.events = Queue()  # Events from mpv, i.e. start-file.
+        self.send_lock = Lock()
+        self.lock = RLock()
+        self.load_lock = Lock()
+        self.session = None
+        Thread(target=self.supervise, daemon=True).start()
+        atexit.register(self.close)  # Don't leave mpv playing after we exit.
+
+    def running(self):
+        """Return whether or not mpv is up."""
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, timeout=5):
+        """
+        Start mpv and connect to it, if it isn't already running.
+
+        Keyword arguments:
+        timeout=5: Max number of seconds to wait for mpv to come up.
+        """
+        if self.running():
+            return
+        self.close()
+
+        self.tmp_dir = mkdtemp(prefix='gpymusic-')
+        sock_path = join(self.tmp_dir, 'mpv.sock')
+        args = self.command_line + [
+            '--idle=yes', '--no-video', '--no-terminal',
+            '--input-ipc-server=%s' % sock_path,
+        ]
+        try:
+            self.process = subprocess.Popen(
+                args, stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise PlayerError('Could not start mpv: %s' % e)
+
+        # mpv creates the socket shortly after it starts.
+        deadline = time() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(sock_path)
+                break
+            except OSError:
+                sock.close()
+                if time() > deadline or not self.running():
+                    self.close()
+                    raise PlayerError('Could not connect to mpv')
+                sleep(0.05)
+
+        self.sock = sock
+        Thread(target=self.read, args=(sock,), daemon=True).start()
+        self.command('observe_property', 1, 'idle-active')
+
+    def read(self, sock):
+        """
+        Read messages from mpv until the connection closes, handing
+          responses to whoever is waiting on them and queueing events.
+
+        Arguments:
+        sock: The connected socket.
+        """
+        with sock.makefile('rb') as f:
+            for line in f:
+                try:
+                    msg = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                if 'request_id' in msg:
+                    waiter = self.responses.get(msg['request_id'])
+                    if waiter is not None:
+                        waiter[1] = msg
+                        waiter[0].set()
+                elif 'event' in msg:
+                    self.events.put(msg)
+        # The connection is gone, so nobody will get a response.
+        for waiter in list(self.responses.values()):
+            waiter[0].set()
+        self.events.put({'event': 'disconnected'})
+
+    def command(self, *args, timeout=5):
+        """
+        Send a command to mpv and wait for its response.
+
+        Arguments:
+        args: The command and its arguments, i.e. 'loadfile', url.
+
+        Keyword arguments:
+        timeout=5: Max number of seconds to wait for a response.
+
+        Returns: The command's result data, if any.
+        """
+        if self.sock is None:
+            raise PlayerError('mpv is not running')
+        id = next(self.ids)
+        waiter = self.responses[id] = [Event(), None]
+        msg = json.dumps({'command': list(args), 'request_id': id})
+        try:
+            with self.send_lock:
+                self.sock.sendall(('%s\n' % msg).encode('utf-8'))
+            if not waiter[0].wait(timeout) or waiter[1] is None:
+                raise PlayerError('No response from mpv')
+        except OSError as e:
+            raise PlayerError('Lost connection to mpv: %s' % e)
+        finally:
+            del self.responses[id]
+        if waiter[1].get('error') != 'success':
+            raise PlayerError(waiter[1].get('error'))
+        return waiter[1].get('data')
+
+    def get(self, name):
+        """
+        Get an mpv property.
+
+        Arguments:
+        name: Property name, i.e. 'volume'.
+
+        Returns: The property's value, or None if it's unavailable.
+        """
+        try:
+            return self.command('get_property', name)
+        except PlayerError:
+            return None
+
+    def loadfile(self, source, append=False):
+        """
+        Load a file or url.
+
+        Arguments:
+        source: File path or url to play.
+
+        Keyword arguments:
+        append=False: Add to the end of the playlist instead of
+          replacing it, for gapless playback.
+        """
+        self.command('loadfile', source, 'append' if append else 'replace')
+
+    def pause(self):
+        """Toggle pause."""
+        self.command('cycle', 'pause')
+
+    def seek(self, seconds):
+        """
+        Seek relative to the current position.
+
+        Arguments:
+        seconds: Number of seconds to seek, negative to go back.
+        """
+        self.command('seek', seconds, 'relative')
+
+    def volume(self, change):
+        """
+        Change the volume.
+
+        Arguments:
+        change: Amount to add to the volume, negative to turn it down.
+        """
+        self.command('add', 'volume', change)
+
+    def skip(self):
+        """Skip to the next song."""
+        self.load_next()
+        self.command('playlist-next', 'force')
+
+    def stop(self):
+        """Stop playback and clear the playlist."""
+        with self.lock:
+            session = self.session
+            if session is not None:
+                session.stopped = True
+        self.command('stop')
+
+    @property
+    def playing(self):
+        """Whether or not we're in the middle of playing something."""
+        return self.session is not None
+
+    def play(self, feed, started=None, finished=None):
+        """
+        Start playing some songs back to back, replacing whatever is
+          playing now. Returns right away: playback carries on in the
+          background, reporting back through the callbacks.
+
+        Arguments:
+        feed: Function returning the next (source, item) to play, where
+          source is a path or url, or None once there are no more songs.
+          Sources are loaded ahead of time, so they mustn't be moved or
+          deleted after they're returned, i.e. a file being downloaded
+          has to be written where it will stay.
+
+        Keyword arguments:
+        started=None: Function called with each item when it starts.
+        finished=None: Function called when playback ends with whether
+          or not it was stopped early, and the items which were fetched
+          from the feed but never started.
+
+        Returns: Whether or not anything is being played.
+        """
+        self.start()
+        # End the old session before taking anything from the feed, so
+        # that songs it hands back go ahead of the one we take.
+        with self.load_lock:
+            with self.lock:
+                old = self.session
+                session = self.session = Session(feed, started, finished)
+            if old is not None:
+                old.end(True)
+            try:
+                first = feed()
+            except BaseException:
+                self.forget(session, old is not None)
+                raise
+            if first is None:
+                self.forget(session, old is not None)
+                return False
+            with self.lock:
+                session.loaded.append(first[1])
+
+        try:
+            self.loadfile(first[0])
+        except PlayerError:
+            self.forget(session)
+            raise
+        return True
+
+    def forget(self, session, stop=False):
+        """
+        Stop following a session which never got going.
+
+        Arguments:
+        session: The Session.
+
+        Keyword arguments:
+        stop=False: Whether or not to stop the song that's playing,
+          which belonged to the session that this one replaced.
+        """
+        with self.lock:
+            if self.session is not session:
+                return
+            self.session = None
+        if stop:
+            try:
+                self.command('stop')
+            except PlayerError:
+                pass
+
+    def supervise(self):
+        """
+        Follow along with mpv's events for as long as the player exists,
+          and load each song shortly before the previous one ends.
+        """
+        checked = 0
+        while True:
+            try:
+                event = self.events.get(timeout=0.5)
+            except Empty:
+                event = {}
+            name = event.get('event')
+
+            with self.lock:
+                session = self.session
+                if session is None:
+                    continue
+                if name == 'start-file' and session.loaded:
+                    session.current = session.loaded.popleft()
+                    item, ended = session.current, False
+                elif name == 'disconnected' or (
+                        name == 'property-change' and
+                        event.get('name') == 'idle-active' and
+                        event.get('data') and session.current is not None
+                ):
+                    self.session, item, ended = None, None, True
+                else:
+                    item, ended = None, False
+
+            try:
+                if item is not None and session.started is not None:
+                    session.started(item)
+                elif ended:
+                    session.end(session.stopped)
+                elif not session.loaded and time() - checked > 1:
+                    checked = time()  # Is it time to load the next one?
+                    remaining = self.get('time-remaining')
+                    if remaining is not None and remaining < Player.preload:
+                        self.load_next()
+            except Exception:  # Keep going no matter what.
+                continue
+
+    def load_next(self):
+        """Append the next song from the feed, if we haven't already."""
+        with self.load_lock:
+            session = self.session
+            if session is None or session.loaded:
+                return
+            # Getting the song can take a while, so don't hold up anyone
+            # else who's using the player.
+            next_song = session.next()
+            if next_song is None:
+                return
+            with self.lock:
+                current = session is self.session
+                if current:
+                    session.loaded.append(next_song[1])
+            if current:
+                self.loadfile(next_song[0], append=True)
+            elif session.finished is not None:  # Give it back.
+                session.finished(True, [next_song[1]])
+
+    def close(self):
+        """Shut down mpv."""
+        if self.sock is not None:
+            try:
+                self.command('quit', timeout=1)
+            except PlayerError:
+                pass
+            self.sock.close()
+            self.sock = None
+        if self.process is not None:
+            try:
+                self.process.wait(1)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        if self.tmp_dir is not None:
+            rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
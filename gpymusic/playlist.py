@@ -0,0 +1,174 @@
+from . import music_objects
+
+from os import replace
+from struct import Struct
+
+import json
+
+
+# Start of every playlist file in the compact format.
+MAGIC = b'GPYPL\x01'
+
+# A table entry: a tag and the length of its JSON.
+entry = Struct('>cI')
+# A song: a tag, its kind, whether it's full, and the table indices of
+# its artist and album. Its id, name, and time follow as strings.
+song = Struct('>ccBII')
+# Length of a string.
+length = Struct('>H')
+
+# Fields every song in a playlist needs.
+fields = ('id', 'name', 'kind', 'full', 'artist', 'album', 'time')
+# Single byte codes for each kind of song.
+kinds = {'song': b's', 'libsong': b'l'}
+kind_names = {code: kind for kind, code in kinds.items()}
+
+
+def is_compact(path):
+    """
+    Check whether a playlist file is in the compact format.
+
+    Arguments:
+    path: Path to the playlist.
+
+    Returns: Whether or not the file starts with the format's magic bytes.
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def stub(item):
+    """
+    Cut a dict from an old playlist down to what to_dict() would write.
+
+    Arguments:
+    item: Dict with a song, artist, or album's information.
+
+    Returns: A copy of item with its nested items made into stubs, and
+      its lists emptied.
+    """
+    d = {}
+    for k, v in item.items():
+        if isinstance(v, dict):
+            v = stub(v)
+            v['full'] = False
+        elif isinstance(v, list):
+            v = []
+        d[k] = v
+    return d
+
+
+def save(path, songs):
+    """
+    Write songs to a playlist file in the compact format. Each song's
+      artist and album are written once, the first time they come up,
+      and later songs refer to them by their position in that table.
+
+    Arguments:
+    path: Path to write to. It's replaced all at once, so a failed write
+      leaves the old file alone.
+    songs: Iterable of songs, as MusicObjects or as dicts like to_dict's.
+
+    Returns: The number of songs written.
+    """
+    table = {}  # JSON text -> index.
+    n = 0
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+
+        def index(val):
+            text = json.dumps(val, sort_keys=True)
+            if text not in table:
+                data = text.encode('utf-8')
+                f.write(entry.pack(b'T', len(data)))
+                f.write(data)
+                table[text] = len(table)
+            return table[text]
+
+        for item in songs:
+            if isinstance(item, music_objects.MusicObject):
+                item = item.to_dict()
+            if item.get('kind') not in kinds:
+                continue
+            refs = index(item['artist']), index(item['album'])
+            f.write(song.pack(
+                b'S', kinds[item['kind']], bool(item['full']), *refs
+            ))
+            for s in (item['id'], item['name'], item['time']):
+                data = s.encode('utf-8')
+                f.write(length.pack(len(data)))
+                f.write(data)
+            n += 1
+    replace(tmp_path, path)
+    return n
+
+
+def load(path):
+    """
+    Read songs from a playlist file in the compact format, one at a time,
+      so that long playlists can be used before they've been read in full.
+
+    Arguments:
+    path: Path to the playlist.
+
+    Returns: A generator of dicts like to_dict's, which is cut short if
+      the file is truncated. Raises ValueError if the file is invalid.
+    """
+    def read(f, n):
+        data = f.read(n)
+        if len(data) < n:
+            raise EOFError
+        return data
+
+    def read_string(f):
+        return read(f, length.unpack(read(f, length.size))[0]).decode('utf-8')
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a compact playlist')
+        table = []
+        while True:
+            tag = f.read(1)
+            if not tag:
+                return
+            try:
+                if tag == b'T':
+                    size = entry.unpack(tag + read(f, entry.size - 1))[1]
+                    table.append(json.loads(read(f, size).decode('utf-8')))
+                elif tag == b'S':
+                    kind, full, artist, album = song.unpack(
+                        tag + read(f, song.size - 1)
+                    )[1:]
+                    id, name, time = (read_string(f) for i in range(3))
+                    yield {
+                        'id': id, 'name': name, 'kind': kind_names[kind],
+                        'full': bool(full), 'artist': table[artist],
+                        'album': table[album], 'time': time,
+                    }
+                else:
+                    raise ValueError('Unknown record in playlist')
+            except EOFError:  # Cut off part way through a record.
+                return
+            except (IndexError, KeyError):
+                raise ValueError('Corrupt playlist')
+
+
+def convert(src, dst):
+    """
+    Convert a JSON playlist to the compact format.
+
+    Arguments:
+    src: Path to the JSON playlist.
+    dst: Path to write the compact playlist to. This may be src.
+
+    Returns: The number of songs converted.
+    """
+    with open(src) as f:
+        songs = json.load(f)
+    if not isinstance(songs, list):
+        raise ValueError('Not a playlist')
+    return save(dst, (
+        stub(s) for s in songs
+        if isinstance(s, dict) and all(k in s for k in fields)
+    ))
@@ -0,0 +1,175 @@
+from . import common
+from . import download
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from os.path import isfile
+from threading import Lock
+from time import time
+from urllib.parse import parse_qs, urlparse
+
+
+class Prefetcher():
+    """
+    Gets upcoming songs ready while the current one plays: stream urls
+      are resolved for streamed songs, and library songs are downloaded.
+      Stream urls are reused until shortly before they expire, and are
+      refreshed in the background as that time approaches.
+    """
+
+    # Seconds that a url is assumed to last if it doesn't say.
+    url_lifetime = 60
+    # Seconds before a url expires at which we stop using it, at most a
+    # quarter of its lifetime.
+    margin = 30
+    # Fraction of a url's lifetime after which we get a new one.
+    refresh = 0.5
+    # Max number of urls to keep.
+    max_urls = 256
+
+    def __init__(self, depth=2, bandwidth=0):
+        """
+        Prefetcher constructor.
+
+        Keyword arguments:
+        depth=2: Number of upcoming songs to prepare.
+        bandwidth=0: Max download speed for library songs in KB/s.
+          0 indicates no limit.
+        """
+        self.configure(depth, bandwidth)
+        # Song id -> (stream url, time resolved, time it expires).
+        self.urls = OrderedDict()
+        self.pending = {}  # Song id -> Future, for urls being resolved.
+        self.lock = Lock()
+        self.pool = ThreadPoolExecutor(max_workers=2)
+
+    def configure(self, depth, bandwidth):
+        """
+        Change how much is prefetched.
+
+        Arguments:
+        depth: Number of upcoming songs to prepare.
+        bandwidth: Max download speed for library songs in KB/s.
+          0 indicates no limit.
+        """
+        self.depth = max(depth, 0)
+        self.rate = bandwidth * 1000 if bandwidth > 0 else None
+
+    def schedule(self, songs):
+        """
+        Start preparing some upcoming songs in the background.
+
+        Arguments:
+        songs: The songs to be played next, in order.
+          Only the first 'depth' of them are prepared.
+        """
+        for song in islice(songs, self.depth):
+            if song['kind'] == 'libsong':
+                if not isfile(song.path()):
+                    download.start(
+                        common.client.mm, song['id'],
+                        common.ac.staging(song['id']),
+                        callback=song.downloaded_callback(), rate=self.rate
+                    )
+            elif common.ac.find(song['id']) is None:  # Not on disk yet.
+                with self.lock:
+                    self.refresh_soon(song['id'])
+
+    def fresh(self, id, refresh=False):
+        """
+        Check for a usable url. Call with the lock held.
+
+        Arguments:
+        id: Song id.
+
+        Keyword arguments:
+        refresh=False: Check whether the url is new enough that it
+          doesn't need refreshing yet, rather than whether it's usable.
+
+        Returns: Whether or not we have a url that isn't about to expire.
+        """
+        if id not in self.urls:
+            return False
+        url, resolved, expires = self.urls[id]
+        lifetime = expires - resolved
+        if refresh:
+            return time() < resolved + lifetime * Prefetcher.refresh
+        return time() < expires - min(Prefetcher.margin, lifetime / 4)
+
+    def refresh_soon(self, id):
+        """
+        Start resolving a url in the background, unless we have one that
+          will last a while or it's already being resolved. Call with the
+          lock held.
+
+        Arguments:
+        id: Song id.
+        """
+        if id not in self.pending and not self.fresh(id, refresh=True):
+            self.pending[id] = self.pool.submit(self.resolve, id)
+
+    @staticmethod
+    def expiry(url):
+        """
+        Find out when a stream url expires. Signed urls carry their expiry
+          time in their 'expire' parameter.
+
+        Arguments:
+        url: The stream url.
+
+        Returns: The time when the url stops working, in seconds since
+          the epoch.
+        """
+        try:
+            return int(parse_qs(urlparse(url).query)['expire'][0])
+        except (KeyError, ValueError):
+            return time() + Prefetcher.url_lifetime
+
+    def resolve(self, id):
+        """
+        Get a song's stream url from Google Play Music.
+
+        Arguments:
+        id: Song id.
+
+        Returns: The stream url.
+        """
+        try:
+            url = common.mc.get_stream_url(id)
+            with self.lock:
+                self.urls[id] = (url, time(), Prefetcher.expiry(url))
+                self.urls.move_to_end(id)
+                while len(self.urls) > Prefetcher.max_urls:
+                    self.urls.popitem(last=False)
+            return url
+        finally:
+            with self.lock:
+                self.pending.pop(id, None)
+
+    def url(self, song):
+        """
+        Get a song's stream url, reusing one we already have if it hasn't
+          expired.
+
+        Arguments:
+        song: The song about to be played.
+
+        Returns: The stream url.
+        """
+        id = song['id']
+        with self.lock:
+            if self.fresh(id):
+                self.urls.move_to_end(id)
+                self.refresh_soon(id)  # In case it's played again.
+                return self.urls[id][0]
+            future = self.pending.get(id)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:  # Try again ourselves.
+                pass
+            with self.lock:
+                if self.fresh(id):
+                    return self.urls[id][0]
+        return self.resolve(id)
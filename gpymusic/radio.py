@@ -0,0 +1,136 @@
+from . import common
+from . import music_objects
+
+from collections import deque
+from threading import Lock, Thread
+
+
+class Radio():
+    """
+    An endless radio station. The queue is topped up with more of the
+      station's tracks in the background whenever it runs low, so it
+      never runs dry while playing.
+    """
+
+    # Keyword argument to create_station and key in a station's seed,
+    # for each kind of item.
+    seeds = {
+        'artist': ('artist_id', 'artistId'),
+        'album': ('album_id', 'albumId'),
+        'song': ('track_id', 'trackId'),
+    }
+
+    def __init__(self, batch=25, low_water=5, history=200):
+        """
+        Radio constructor. No station is playing until start() is called.
+
+        Keyword arguments:
+        batch=25: Number of tracks to fetch at a time.
+        low_water=5: Fetch more once the queue has fewer songs than this.
+        history=200: Number of recent tracks to avoid repeating.
+        """
+        self.batch = batch
+        self.low_water = low_water
+        self.station_id = None
+        self.recent = deque(maxlen=history)  # Ids of tracks we've queued.
+        self.stations = None  # (Seed key, seed id) -> station id.
+        self.lock = Lock()
+        self.fetching = False
+
+    def station(self, item):
+        """
+        Find a station for an item, reusing one of the user's stations
+          with the same seed if there is one.
+
+        Arguments:
+        item: The song, artist, or album to base the station on.
+
+        Returns: The station id.
+        """
+        arg, seed_key = Radio.seeds[item['kind']]
+        if self.stations is None:
+            self.stations = {}
+            for station in common.mc.get_all_stations():
+                seed = station.get('seed', {})
+                if station.get('deleted') or 'id' not in station:
+                    continue
+                for key in seed:
+                    self.stations[(key, seed[key])] = station['id']
+
+        key = (seed_key, item['id'])
+        if key not in self.stations:
+            self.stations[key] = common.mc.create_station(
+                '%s radio' % item['name'], **{arg: item['id']}
+            )
+        return self.stations[key]
+
+    def start(self, item):
+        """
+        Replace the queue with a station's tracks, and keep it topped up.
+
+        Arguments:
+        item: The song, artist, or album to base the station on.
+
+        Returns: The number of tracks queued.
+        """
+        station_id = self.station(item)
+        with self.lock:
+            self.station_id = station_id
+        common.q.clear()
+        return self.fetch(station_id)
+
+    def stop(self):
+        """Stop topping up the queue."""
+        with self.lock:
+            self.station_id = None
+
+    def fetch(self, station_id):
+        """
+        Add a batch of the station's tracks to the queue, skipping any
+          which were queued recently.
+
+        Arguments:
+        station_id: The station to get tracks from.
+
+        Returns: The number of tracks queued.
+        """
+        tracks = common.mc.get_station_tracks(
+            station_id, num_tracks=self.batch,
+            recently_played_ids=list(self.recent)
+        )
+        songs = []
+        with self.lock:
+            if station_id != self.station_id:  # Changed in the meantime.
+                return 0
+            seen = set(self.recent)
+            for track in tracks:
+                song = music_objects.Song(track)
+                if song['id'] not in seen:
+                    seen.add(song['id'])
+                    self.recent.append(song['id'])
+                    songs.append(song)
+        return common.q.extend(songs)
+
+    def check(self):
+        """
+        Start fetching more tracks in the background if the queue is
+          running low.
+        """
+        with self.lock:
+            station_id = self.station_id
+            if (
+                    station_id is None or self.fetching or
+                    len(common.q) >= self.low_water
+            ):
+                return
+            self.fetching = True
+
+        def refill():
+            try:
+                self.fetch(station_id)
+            except Exception:  # Try again when the next song starts.
+                pass
+            finally:
+                with self.lock:
+                    self.fetching = False
+        Thread(target=refill, daemon=True).start()
@@ -1,13 +1,93 @@
 from . import common
 from . import music_objects
 
+from collections import deque
+from itertools import islice
+from random import shuffle
+from threading import RLock, Thread
 
-class Queue(list):
-    """A queue of songs to be played."""
 
-    def __init__(self):
-        """Create an empty Queue."""
-        super().__init__(self)
+class Queue():
+    """
+    A queue of songs to be played. Songs are kept in a deque whose head
+      is the next song to play, so playback advances by taking songs off
+      the front without copying or shifting the rest. The queue is
+      shared with playback and radio threads, so access is locked.
+      Changes can be written to a Journal, so they survive a crash.
+    """
+
+    def __init__(self, items=()):
+        """
+        Create a Queue.
+
+        Keyword arguments:
+        items=(): Songs or albums to start with.
+        """
+        self.songs = deque()
+        self.lock = RLock()
+        self.journal = None
+        self.generation = 0  # Goes up whenever the queue is cleared.
+        self.extend(items)
+
+    def attach(self, journal):
+        """
+        Start recording changes in a journal, replacing the queue's
+          contents with what was recorded in it before.
+
+        Arguments:
+        journal: The Journal to use.
+
+        Returns: The number of songs restored.
+        """
+        songs = journal.replay()
+        with self.lock:
+            self.songs = deque(songs)
+            self.journal = journal
+            return len(self.songs)
+
+    def log(self, op, *args):
+        """
+        Record a change in the journal, if there is one. Hold the lock.
+
+        Arguments:
+        op: Name of the change, i.e. 'add'.
+        args: Its arguments.
+        """
+        if self.journal is not None:
+            self.journal.write(op, *args)
+            if self.journal.due(len(self.songs)):
+                self.journal.compact(self.songs)
+
+    @staticmethod
+    def expand(item):
+        """
+        Get the songs that an item adds to the queue.
+
+        Arguments:
+        item: A song or album.
+
+        Returns: A list of songs.
+        """
+        if item['kind'] == 'album':
+            return item['songs']
+        elif item['kind'] in ('song', 'libsong'):
+            return [item]
+        else:
+            raise TypeError('Adding invalid type to queue.')
+
+    def __len__(self):
+        """Return the number of songs in the queue."""
+        return len(self.songs)
+
+    def __iter__(self):
+        """Iterate over a snapshot of the queue's songs."""
+        with self.lock:
+            return iter(list(self.songs))
+
+    def __getitem__(self, i):
+        """Get the song at some position."""
+        with self.lock:
+            return self.songs[i]
 
     def append(self, item):
         """
@@ -19,14 +99,7 @@ class Queue(list):
 
         Returns: Number of songs that were added.
         """
-        if item['kind'] == 'album':
-            super().extend(item['songs'])
-            return len(item['songs'])
-        elif item['kind'] in ('song', 'libsong'):
-            super().append(item)
-            return 1
-        else:
-            raise TypeError('Adding invalid type to queue.')
+        return self.extend([item])
 
     def extend(self, items):
         """
@@ -38,7 +111,108 @@ class Queue(list):
 
         Returns: number of songs that were successfully inserted.
         """
-        return sum(self.append(item) for item in items)
+        songs = [song for item in items for song in Queue.expand(item)]
+        with self.lock:
+            self.songs.extend(songs)
+            if songs:
+                self.log('add', songs)
+        return len(songs)
+
+    def clear(self):
+        """Remove every song from the queue."""
+        with self.lock:
+            self.songs.clear()
+            self.generation += 1
+            if self.journal is not None:
+                self.journal.compact(self.songs, None)
+
+    def advance(self):
+        """
+        Take the next song off the front of the queue.
+
+        Returns: The song, or None if the queue is empty.
+        """
+        with self.lock:
+            if not self.songs:
+                return None
+            song = self.songs.popleft()
+            self.log('advance', song)
+            return song
+
+    def started(self, song):
+        """
+        Record that a song taken off the queue has started playing, so
+          that it's the one put back at the front after a crash.
+
+        Arguments:
+        song: The song.
+        """
+        with self.lock:
+            self.log('start', song)
+
+    def requeue(self, songs):
+        """
+        Put songs back at the front of the queue, i.e. ones which were
+          taken off but never played.
+
+        Arguments:
+        songs: List of songs, in the order they should be played.
+        """
+        with self.lock:
+            self.songs.extendleft(reversed(songs))
+            self.log('front', songs)
+
+    def peek(self, n=1):
+        """
+        Look at the songs coming up without taking them off the queue.
+
+        Keyword arguments:
+        n=1: Number of songs to look at.
+
+        Returns: A list of at most n songs.
+        """
+        with self.lock:
+            return list(islice(self.songs, n))
+
+    def remove(self, i):
+        """
+        Remove the song at some position. Deques only shift the items
+          between the position and the nearer end, so removing near
+          either end of a long queue is cheap.
+
+        Arguments:
+        i: Position of the song, starting from 0.
+
+        Returns: The removed song.
+        """
+        with self.lock:
+            song = self.songs[i]
+            del self.songs[i]
+            self.log('remove', i)
+            return song
+
+    def move(self, src, dst):
+        """
+        Move a song to another position.
+
+        Arguments:
+        src: Current position of the song.
+        dst: Position to move it to.
+        """
+        with self.lock:
+            song = self.songs[src]
+            del self.songs[src]
+            self.songs.insert(dst, song)
+            self.log('move', src, dst)
+
+    def shuffle(self):
+        """Put the queue in a random order."""
+        with self.lock:
+            songs = list(self.songs)
+            shuffle(songs)
+            self.songs = deque(songs)
+            if self.journal is not None:
+                self.journal.compact(self.songs)
 
     def collect(self, limit=-1):
         """
@@ -50,39 +224,71 @@ class Queue(list):
 
         Returns: A dict with key 'songs'.
         """
-        return {
-            'songs': self[:min(limit, len(self)) if limit != -1 else len(self)]
-        }
+        with self.lock:
+            songs = self.songs if limit == -1 else islice(self.songs, limit)
+            return {'songs': list(songs)}
 
     def play(self):
-        """Play the queue. If playback is halted, restore unplayed items."""
-        cache = self[:]
-        del self[:]
-        l = len(cache)
-        if cache[0]['kind'] == 'libsong':  # Playing library songs.
-            for i in range(l):
-                s = cache.pop(0)
-                common.w.now_playing(
-                    '(%d/%d) %s (%s)' % (i + 1, l, str(s), s['time'])
+        """
+        Play the queue in the background. Songs leave the queue as they're
+          played, and any added in the meantime are played too. If
+          playback is halted, unplayed songs stay in the queue.
+        """
+        music_objects.MusicObject.play(self, taken=common.radio.check)
+
+    def restore(self, items, chunk=500):
+        """
+        Replace the queue with songs from a playlist. The first few are
+          added right away and the rest in the background, so a long
+          playlist can be played and browsed while it loads.
+
+        Arguments:
+        items: Iterable of dicts with songs' information, as written to
+          playlist files. It's read as the songs are added.
+
+        Keyword arguments:
+        chunk=500: Number of songs to add at a time.
+        """
+        items = iter(items)
+        with self.lock:
+            self.clear()
+            generation = self.generation
+
+        def add_chunk():
+            batch = list(islice(items, chunk))
+            songs = [
+                music_objects.mapping[song['kind'] + 's']['cls'](
+                    song, source='json'
+                ) for song in batch if music_objects.Song.verify(song)
+            ]
+            with self.lock:
+                if generation != self.generation:  # Replaced meanwhile.
+                    return False
+                self.extend(songs)
+            return len(batch) == chunk
+
+        def add_rest():
+            try:
+                while add_chunk():
+                    common.w.outbar_msg(
+                        'Restoring playlist... %d songs' % len(self)
+                    )
+            except (OSError, ValueError) as e:
+                common.w.error_msg('Playlist is damaged (%s)' % e)
+                return
+            if generation == self.generation:
+                common.w.outbar_msg(
+                    'Restored %d songs from playlist.' % len(self)
                 )
-                common.v['songs'].pop(0)
-                if s.play() is 11:
-                    self.extend(cache)
-                    break
-                common.w.display()
-
-        else:  # Streaming songs.
-            index = music_objects.MusicObject.play(cache)
-            self.extend(cache[index:])
-        common.w.now_playing()
-        common.w.erase_outbar()
-
-    def restore(self, json):
-        songs = [
-            music_objects.mapping[song['kind'] + 's']['cls'](
-                song, source='json'
-            ) for song in json if music_objects.Song.verify(song)
-        ]
-        del self[:]
-        self.extend(songs)
-        common.w.outbar_msg('Restored %d songs from playlist.' % len(self))
+
+        try:
+            more = add_chunk()
+        except (OSError, ValueError) as e:
+            common.w.error_msg('Playlist is damaged (%s)' % e)
+            return
+        if more:
+            Thread(target=add_rest, daemon=True).start()
+        else:
+            common.w.outbar_msg(
+                'Restored %d songs from playlist.' % len(self)
+            )
@@ -1,4 +1,5 @@
 from . import common
+from . import journal
 
 from getpass import getpass
 from os.path import basename, exists, expanduser, isfile, join
@@ -45,6 +46,43 @@ def validate_config(config):
             filename = '~/.nowplaying'
         common.np.initialise(expanduser(filename))
 
+    if 'prefetch' in config:
+        try:
+            common.pf.configure(
+                int(config['prefetch'].get('depth', 2)),
+                int(config['prefetch'].get('bandwidth', 0)),
+            )
+        except (AttributeError, ValueError):
+            common.w.outbar_msg(
+                'Invalid prefetch settings: Using defaults.')
+            sleep(1.5)
+
+    if 'audio_cache' in config:
+        try:
+            common.ac.configure(int(config['audio_cache'].get('quota', 1024)))
+        except (AttributeError, ValueError):
+            common.w.outbar_msg(
+                'Invalid audio cache settings: Using defaults.')
+            sleep(1.5)
+
+    if 'cache' in config:
+        try:
+            persist = config['cache'].get('persist', 'yes') == 'yes'
+            common.mdc.configure(
+                int(config['cache'].get('size', 256)),
+                join(common.DATA_DIR, 'metadata.json') if persist else None,
+            )
+        except (AttributeError, ValueError):
+            common.w.outbar_msg('Invalid cache settings: Using defaults.')
+            sleep(1.5)
+
+    if config.get('queue', {}).get('persist', 'yes') == 'yes':
+        restored = common.q.attach(
+            journal.Journal(join(common.DATA_DIR, 'queue.journal'))
+        )
+        if restored:
+            common.w.outbar_msg('Restored %d songs to the queue.' % restored)
+
     # Check if there is any colour info.
     if 'colour' in config and 'enable' not in config['colour']:
         common.w.goodbye('Missing colour enable flag in config file: Exiting.')
@@ -243,12 +281,12 @@ def easy_login():
 
 def login(user):
     """
-    Log into Google Play Music. Succeeds or exits.
+    Log into Google Play Music. Succeeds or exits. This can run in the
+      background while the prompt is up.
 
     Arguments:
     user: Dict containing auth information.
     """
-    crs.curs_set(0)
     common.w.outbar_msg('Logging in...')
     try:
         if not common.mc.login(user['email'], user['password'], user['deviceid']):
@@ -1,5 +1,11 @@
 class View(dict):
-    """A View contains the content displayed in the main window."""
+    """
+    A View contains the content displayed in the main window. Its lists
+      can be any length: only the rows from offset onwards are drawn.
+    """
+
+    # Order in which the lists are displayed and numbered.
+    order = ('songs', 'artists', 'albums')
 
     def __init__(self, d=None):
         """
@@ -11,6 +17,7 @@ class View(dict):
           'albums' are created with empty lists as default values.
         """
         self['songs'], self['artists'], self['albums'] = [], [], []
+        self.offset = 0  # Index of the first item on screen.
         if d is not None:
             if isinstance(d, dict):
                 for k in d:
@@ -36,6 +43,37 @@ class View(dict):
         """Clear elements without removing keys."""
         for k in self.keys():
             del self[k][:]
+        self.offset = 0
+
+    def scroll(self, n):
+        """
+        Move the viewport, keeping at least one item on screen.
+
+        Arguments:
+        n: Number of items to scroll down by, negative to scroll up.
+        """
+        self.offset = max(min(self.offset + n, len(self) - 1), 0)
+
+    def locate(self, num):
+        """
+        Find a numbered item. Numbers run through the lists in display
+          order, so only the lists' lengths are needed to find one, no
+          matter how long they are.
+
+        Arguments:
+        num: Number of the item, as displayed, starting from 1.
+
+        Returns: A (key, index) tuple, or None if there's no such item.
+        """
+        if num < 1:
+            return None
+        i = num - 1
+        for key in View.order:
+            if key in self:
+                if i < len(self[key]):
+                    return key, i
+                i -= len(self[key])
+        return None
 
     def is_empty(self):
         """Returns whether or not the view is empty."""
@@ -1,11 +1,35 @@
 from . import common
+from . import lazy
 
+from functools import wraps
+from itertools import islice
+from threading import RLock, current_thread, main_thread
 from time import sleep
+from weakref import WeakKeyDictionary
 
 import curses as crs
 import sys
 
 
+def drawing(f):
+    """
+    Decorator for Writer methods which draw on the screen. Playback and
+      commands draw from their own threads, so only one thread may draw
+      at a time. Drawing methods only mark windows for refreshing,
+      and afterwards the changes are sent to the terminal all at once,
+      with the cursor back in the input bar.
+    """
+    @wraps(f)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            result = f(self, *args, **kwargs)
+            if self.curses and self.inbar is not None:
+                self.inbar.noutrefresh()
+                crs.doupdate()
+        return result
+    return wrapper
+
+
 class Writer():
 
     def __init__(
@@ -38,6 +62,11 @@ class Writer():
         self.test = test
         self.xlimit = self.main.getmaxyx()[1] if main is not None else 0
         self.ylimit = self.main.getmaxyx()[0] if main is not None else 0
+        self.lock = RLock()
+        self.frame = None  # Rows currently in the main window, if known.
+        # Item -> (field widths, truncated field strings).
+        self.row_cache = WeakKeyDictionary()
+        self.buffer = ''  # What's been typed at the prompt so far.
 
     @staticmethod
     def trunc(string, ch):
@@ -64,7 +93,9 @@ class Writer():
         self.outbar = outbar
         self.ylimit = self.main.getmaxyx()[0]
         self.xlimit = self.main.getmaxyx()[1]
+        self.frame = None
 
+    @drawing
     def addstr(self, win, string):
         """
         Replace the contents of a window with a new string.
@@ -81,8 +112,9 @@ class Writer():
 
         win.erase()
         win.addstr(Writer.trunc(string, self.xlimit - 1))
-        win.refresh()
+        win.noutrefresh()
 
+    @drawing
     def refresh(self):
         """Refresh all windows."""
         if not self.curses:
@@ -93,6 +125,7 @@ class Writer():
         self.infobar.refresh()
         self.outbar.refresh()
 
+    @drawing
     def now_playing(self, string=None):
         """
         Show 'now playing' information. If both kwargs are None,
@@ -107,13 +140,14 @@ class Writer():
         self.addstr(self.infobar, 'Now playing: %s' %
                     (string if string is not None else 'None'))
 
+    @drawing
     def erase_outbar(self):
         """Erases content on the outbar."""
         if not self.curses:
             return
 
         self.outbar.erase()
-        self.outbar.refresh()
+        self.outbar.noutrefresh()
 
     def error_msg(self, msg):
         """
@@ -129,6 +163,7 @@ class Writer():
         self.addstr(
             self.outbar, 'Error: %s. Enter \'h\' or \'help\' for help.' % msg)
 
+    @drawing
     def welcome(self):
         """Displays a welcome message."""
         if not self.curses:
@@ -136,11 +171,12 @@ class Writer():
                 print('Welcome to Google Py Music!')
             return
 
+        self.frame = None
         try:
             self.main.addstr(
                 5, int(crs.COLS / 2) - 13, 'Welcome to Google Py Music!'
             )
-            self.main.refresh()
+            self.main.noutrefresh()
         except:  # If this errors for some reason, just don't display anything.
             pass
 
@@ -156,8 +192,15 @@ class Writer():
                 print(msg)
             sys.exit()
 
+        if current_thread() is not main_thread():
+            # Only the main thread can exit, so hand it over.
+            common.loop.call_soon(lambda: self.goodbye(msg))
+            sys.exit()  # Ends this thread.
+
         self.addstr(self.outbar, msg)
-        common.mc.logout()
+        common.player.close()
+        if lazy.loaded(common.mc):
+            common.mc.logout()
         try:
             common.client.mm.logout()
         except:
@@ -190,6 +233,56 @@ class Writer():
 
         return string.decode('utf-8')
 
+    @drawing
+    def prompt(self):
+        """Show the input bar with whatever has been typed so far."""
+        if not self.curses:
+            return
+
+        crs.noecho()  # We echo keys ourselves, so output can't garble them.
+        crs.cbreak()
+        self.inbar.keypad(True)  # Report arrow keys as single codes.
+        self.inbar.nodelay(True)
+        crs.curs_set(2)  # Show the cursor.
+        self.inbar.erase()
+        self.inbar.addstr(Writer.trunc('> %s' % self.buffer, self.xlimit - 1))
+
+    def read_keys(self):
+        """
+        Get every key that has been pressed in the input bar, without
+          waiting.
+
+        Returns: A list of keys, either characters or curses key codes.
+        """
+        keys = []
+        with self.lock:
+            while True:
+                try:
+                    keys.append(self.inbar.get_wch())
+                except crs.error:  # Nothing left.
+                    return keys
+
+    def edit(self, key):
+        """
+        Apply a keypress to the input line.
+
+        Arguments:
+        key: A character or curses key code.
+
+        Returns: The finished line if the key was enter, otherwise None.
+        """
+        line = None
+        if key in ('\n', '\r', crs.KEY_ENTER):
+            line, self.buffer = self.buffer, ''
+        elif key in ('\b', '\x7f', crs.KEY_BACKSPACE):
+            self.buffer = self.buffer[:-1]
+        elif key == '\x15':  # Ctrl-U.
+            self.buffer = ''
+        elif isinstance(key, str) and key.isprintable():
+            self.buffer += key
+        self.prompt()
+        return line
+
     def outbar_msg(self, msg):
         """
         Display a basic output message.
@@ -201,7 +294,7 @@ class Writer():
             return
         self.addstr(self.outbar, msg)
 
-    def measure_fields(self, width):
+    def measure_fields(self, width, i_ch=3):
         """
         Determine max number of characters and starting point
           for category fields.
@@ -209,11 +302,13 @@ class Writer():
         Arguments:
         width: Width of the window being divided.
 
+        Keyword arguments:
+        i_ch=3: Characters to allocate for index.
+
         Returns: A tuple containing character allocations
           and start positions.
         """
         padding = 1  # Space between fields.
-        i_ch = 3  # Characters to allocate for index.
         # Width of each name, artist, and album fields.
         n_ch = ar_ch = al_ch = int((width - i_ch - 3 * padding) / 3)
         al_ch -= 1  # Hacky guard against overflow.
@@ -231,6 +326,7 @@ class Writer():
         return (i_ch, n_ch, ar_ch, al_ch,
                 n_start, ar_start, al_start)
 
+    @drawing
     def display(self):
         """Update the main window with some content."""
         if common.v.is_empty():
@@ -258,102 +354,112 @@ class Writer():
                     i += 1
             return
 
-        cl = self.colour
-        self.main.erase()
-        y, i = 0, 1  # y coordinate in main window, current item index.
+        # Make room for the biggest index, so long lists stay aligned.
         (i_ch, n_ch, ar_ch, al_ch, n_start,
-         ar_start, al_start) = self.measure_fields(self.xlimit)
+         ar_start, al_start) = self.measure_fields(
+             self.xlimit, max(3, len(str(len(c))))
+        )
+        cl = self.colour
+        head = crs.color_pair(2) if cl else crs.A_UNDERLINE
+        c.scroll(0)  # Items might have been removed since we scrolled.
+        # Each row is (attribute, ((x, string), ...)).
+        frame = []
+        skip = c.offset  # Items above the viewport.
+        i = 1  # Index of the first item in the current section.
+
+        def add_items(key, titles, starts, widths):
+            # Only the visible part of each list is looked at, so drawing
+            # costs the same no matter how long the lists are.
+            nonlocal i, skip
+            items = c[key] if key in c else []
+            first, base = skip, i
+            skip = max(skip - len(items), 0)
+            i += len(items)
+            if first >= len(items) or len(frame) >= self.ylimit - 1:
+                return
+            frame.append((head, tuple(
+                (x, Writer.trunc(t, ch))
+                for x, t, ch in zip((0,) + starts, ('#',) + titles,
+                                    (i_ch,) + widths)
+            )))
+            last = first + self.ylimit - len(frame)
+            for n, item in enumerate(islice(items, first, last), first):
+                y = len(frame)
+                attr = crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0
+                frame.append((attr, ((0, str(base + n).zfill(2)),) + tuple(
+                    zip(starts, self.row_fields(item, widths))
+                )))
+
+        add_items('songs', ('Title', 'Artist', 'Album'),
+                  (n_start, ar_start, al_start), (n_ch, ar_ch, al_ch))
+        add_items('artists', ('Artist',), (n_start,), (n_ch,))
+        add_items('albums', ('Album', 'Artist'),
+                  (n_start, ar_start), (n_ch, ar_ch))
+
+        self.draw_frame(frame)
+
+    def page(self, pages):
+        """
+        Scroll the main window.
 
-        # Songs header.
-        if 'songs' in c and c['songs']:
-            self.main.addstr(
-                y, 0, '#', crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, n_start, Writer.trunc('Title', n_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, ar_start, Writer.trunc('Artist', ar_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, al_start, Writer.trunc('Album', al_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
-
-            y += 1
-
-            # Write each song.
-            for song in c['songs']:
-                self.main.addstr(
-                    y, 0, str(i).zfill(2),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                self.main.addstr(
-                    y, n_start, Writer.trunc(song['name'], n_ch),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                if song['kind'] == 'song':
-                    self.main.addstr(
-                        y, ar_start, Writer.trunc(song['artist']['name'], ar_ch),  # noqa
-                        crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                    self.main.addstr(
-                        y, al_start, Writer.trunc(song['album']['name'], al_ch),  # noqa
-                        crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                else:
-                    self.main.addstr(
-                        y, ar_start, Writer.trunc(song['artist'], ar_ch),
-                        crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                    self.main.addstr(
-                        y, al_start, Writer.trunc(song['album'], al_ch),
-                        crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-
-                y += 1
-                i += 1
-
-        # Artists header.
-        if 'artists' in c and c['artists']:
-            self.main.addstr(
-                y, 0, '#', crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, ar_start, Writer.trunc('Artist', n_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
+        Arguments:
+        pages: Number of screens to scroll down by, negative to go up.
+        """
+        if self.curses:
+            common.v.scroll(pages * max(self.ylimit - 2, 1))
+            self.display()
 
-            y += 1
+    def row_fields(self, item, widths):
+        """
+        Get the strings to show in an item's row, reusing them if the
+          item was drawn at the same widths before.
 
-            # Write each artist.
-            for artist in c['artists']:
-                self.main.addstr(
-                    y, 0, str(i).zfill(2),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                self.main.addstr(
-                    y, n_start, Writer.trunc(artist['name'], n_ch),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
+        Arguments:
+        item: The MusicObject being drawn.
+        widths: Tuple of max lengths for each field.
 
-                y += 1
-                i += 1
+        Returns: A tuple of truncated strings.
+        """
+        cached = self.row_cache.get(item)
+        if cached is not None and cached[0] == widths:
+            return cached[1]
+
+        if item['kind'] == 'song':
+            fields = (item['name'], item['artist']['name'],
+                      item['album']['name'])
+        elif item['kind'] == 'libsong':
+            fields = (item['name'], item['artist'], item['album'])
+        elif item['kind'] == 'album':
+            fields = (item['name'], item['artist']['name'])
+        else:
+            fields = (item['name'],)
+        fields = tuple(Writer.trunc(f, ch) for f, ch in zip(fields, widths))
+        self.row_cache[item] = (widths, fields)
+        return fields
 
-        # Albums header.
-        if 'albums' in c and c['albums']:
-            self.main.addstr(
-                y, 0, '#', crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, n_start, Writer.trunc('Album', n_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
-            self.main.addstr(
-                y, ar_start, Writer.trunc('Artist', ar_ch),
-                crs.color_pair(2) if cl else crs.A_UNDERLINE)
-
-            y += 1
-
-            # Write each album.
-            for album in c['albums']:
-                self.main.addstr(
-                    y, 0, str(i).zfill(2),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                self.main.addstr(
-                    y, n_start, Writer.trunc(album['name'], n_ch),
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-                self.main.addstr(
-                    y, ar_start, Writer.trunc(album['artist']['name'], ar_ch),  # noqa
-                    crs.color_pair(3 if y % 2 == 0 else 4) if cl else 0)
-
-                y += 1
-                i += 1
+    def draw_frame(self, frame):
+        """
+        Draw rows in the main window, only touching the lines which
+          differ from what's already there.
 
-        self.main.refresh()
+        Arguments:
+        frame: List of (attribute, ((x, string), ...)) rows.
+        """
+        old = self.frame if self.frame is not None else []
+        if self.frame is None:
+            self.main.erase()
+
+        for y, row in enumerate(frame):
+            if y < len(old) and old[y] == row:
+                continue
+            self.main.move(y, 0)
+            self.main.clrtoeol()
+            attr, segments = row
+            for x, string in segments:
+                self.main.addstr(y, x, string, attr)
+        for y in range(len(frame), len(old)):  # Clear leftover rows.
+            self.main.move(y, 0)
+            self.main.clrtoeol()
+
+        self.frame = frame
+        self.main.noutrefresh()
@@ -38,6 +38,7 @@ setup(
         'bin/gpymusic-setup',
         'bin/gpymusic-download-all',
         'bin/gpymusic-get-dev-id',
-        'bin/gpymusic-oauth-login'
+        'bin/gpymusic-oauth-login',
+        'bin/gpymusic-convert-playlist'
     ],
 )
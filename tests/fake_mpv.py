@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+A stand-in for mpv which speaks just enough of its JSON IPC protocol for
+  Player: it answers commands, and "plays" each file for a fixed number
+  of seconds, sending start-file and idle-active events as it goes.
+
+Usage: fake_mpv.py [--length=SECONDS] --input-ipc-server=PATH ...
+"""
+
+from threading import Lock, Thread
+from time import sleep, time
+
+import json
+import socket
+import sys
+
+
+class FakeMpv():
+    """A single IPC connection and the playlist behind it."""
+
+    def __init__(self, conn, length):
+        """
+        FakeMpv constructor.
+
+        Arguments:
+        conn: Connected client socket.
+        length: Number of seconds that each file plays for.
+        """
+        self.conn = conn
+        self.length = length
+        self.playlist = []
+        self.pos = None  # Index of the file playing now.
+        self.started = 0  # When it started.
+        self.lock = Lock()
+
+    def send(self, msg):
+        """Send a message to the client."""
+        self.conn.sendall(('%s\n' % json.dumps(msg)).encode('utf-8'))
+
+    def idle(self, idle):
+        """Tell the client whether or not we're idle."""
+        self.send({
+            'event': 'property-change', 'id': 1,
+            'name': 'idle-active', 'data': idle,
+        })
+
+    def play(self, pos):
+        """Start playing a playlist entry, or go idle if there isn't one."""
+        if pos < len(self.playlist):
+            self.pos, self.started = pos, time()
+            self.send({'event': 'start-file'})
+            self.idle(False)
+        else:
+            self.pos = None
+            self.idle(True)
+
+    def tick(self):
+        """Move on to the next file whenever one finishes."""
+        while True:
+            sleep(0.02)
+            with self.lock:
+                if self.pos is not None and (
+                        time() - self.started >= self.length
+                ):
+                    self.send({'event': 'end-file', 'reason': 'eof'})
+                    self.play(self.pos + 1)
+
+    def handle(self, args):
+        """
+        Run a command.
+
+        Arguments:
+        args: The command and its arguments.
+
+        Returns: The command's result data, if any.
+        """
+        name = args[0]
+        if name == 'observe_property':
+            self.idle(self.pos is None)
+        elif name == 'loadfile':
+            if len(args) > 2 and args[2] == 'append':
+                self.playlist.append(args[1])
+            else:
+                self.playlist = [args[1]]
+                self.play(0)
+        elif name == 'get_property':
+            if args[1] == 'time-remaining' and self.pos is not None:
+                return self.length - (time() - self.started)
+            raise KeyError('property unavailable')
+        elif name == 'playlist-next':
+            self.send({'event': 'end-file', 'reason': 'stop'})
+            self.play(self.pos + 1 if self.pos is not None else 0)
+        elif name == 'stop':
+            self.playlist = []
+            if self.pos is not None:
+                self.send({'event': 'end-file', 'reason': 'stop'})
+            self.play(0)
+        elif name == 'quit':
+            sys.exit(0)
+        return None
+
+    def serve(self):
+        """Answer commands until the client goes away."""
+        Thread(target=self.tick, daemon=True).start()
+        with self.conn.makefile('rb') as f:
+            for line in f:
+                msg = json.loads(line.decode('utf-8'))
+                reply = {'request_id': msg['request_id'], 'error': 'success'}
+                with self.lock:
+                    try:
+                        reply['data'] = self.handle(msg['command'])
+                    except KeyError as e:
+                        reply['error'] = e.args[0]
+                    except SystemExit:
+                        self.send(reply)
+                        raise
+                    self.send(reply)
+
+
+def main(argv):
+    """Listen where Player asks us to, and serve one connection."""
+    opts = dict(
+        arg[2:].split('=', 1) for arg in argv if arg.startswith('--') and
+        '=' in arg
+    )
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(opts['input-ipc-server'])
+    server.listen(1)
+    conn, _ = server.accept()
+    FakeMpv(conn, float(opts.get('length', 1))).serve()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,94 @@
+from gpymusic import audiocache
+
+from os import listdir
+from os.path import isfile, join
+from tempfile import TemporaryDirectory
+
+import atexit
+import unittest
+
+
+class TestAudioCache(unittest.TestCase):
+    """Keep songs in a cache with a tiny quota."""
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = join(self.tmp.name, 'audio')
+        self.cache = self.open(quota=0)
+        self.cache.quota = 250  # Bytes, so that two songs fit.
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self, **kwargs):
+        """Open the cache, without saving it when the tests exit."""
+        cache = audiocache.AudioCache(self.path, **kwargs)
+        atexit.unregister(cache.save)
+        return cache
+
+    def add(self, id, data):
+        """Download a song to the cache's staging area, and add it."""
+        path = self.cache.staging(id)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return self.cache.add(id, path)
+
+    def test_add_and_get(self):
+        blob = self.add('1', b'a' * 100)
+        self.assertEqual(self.cache.get('1'), blob)
+        self.assertIsNone(self.cache.get('2'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual((stats['songs'], stats['size']), (1, 100))
+
+    def test_find_has_no_side_effects(self):
+        self.add('1', b'a' * 100)
+        self.add('2', b'b' * 100)
+        self.cache.find('1')
+        self.cache.find('3')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        # Finding song 1 didn't make it the most recently played.
+        self.add('3', b'c' * 100)
+        self.assertIsNone(self.cache.find('1'))
+        self.assertIsNotNone(self.cache.find('2'))
+
+    def test_eviction(self):
+        self.add('1', b'a' * 100)
+        self.add('2', b'b' * 100)
+        self.cache.get('1')  # Played more recently than song 2.
+        self.add('3', b'c' * 100)
+        self.assertIsNotNone(self.cache.find('1'))
+        self.assertIsNone(self.cache.find('2'))
+        self.assertIsNotNone(self.cache.find('3'))
+        self.assertEqual(self.cache.stats()['size'], 200)
+
+    def test_shared_content(self):
+        blob = self.add('1', b'a' * 100)
+        self.assertEqual(self.add('2', b'a' * 100), blob)
+        self.assertEqual(self.cache.stats()['size'], 100)
+        self.cache.discard('1')
+        self.assertTrue(isfile(blob))  # Song 2 still needs it.
+        self.cache.discard('2')
+        self.assertFalse(isfile(blob))
+
+    def test_damaged_file(self):
+        blob = self.add('1', b'a' * 100)
+        self.cache.save()
+        with open(blob, 'r+b') as f:
+            f.write(b'b')
+        # A new session checks the file before using it.
+        cache = self.open()
+        self.assertIsNone(cache.get('1'))
+        self.assertFalse(isfile(blob))
+
+    def test_incoming_cleaned(self):
+        with open(self.cache.staging('1'), 'wb') as f:
+            f.write(b'partial')
+        cache = self.open()
+        cache.staging('2')
+        self.assertEqual(listdir(join(self.path, 'incoming')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from gpymusic import cache
+
+import unittest
+
+
+class TestSearchCache(unittest.TestCase):
+    """Remember search results from a stubbed search function."""
+
+    def setUp(self):
+        self.calls = []
+        self.cache = cache.SearchCache(self.search, size=2)
+
+    def search(self, query, max_results):
+        """Record a search, and return max_results hits of each type."""
+        self.calls.append((query, max_results))
+        return {
+            'song_hits': list(range(max_results)),
+            'album_hits': list(range(max_results)),
+            'other': 'kept',
+        }
+
+    def test_normalized(self):
+        self.cache.search('Daft  Punk', 10)
+        result = self.cache.search(' daft punk ', 10)
+        self.assertEqual(self.calls, [('Daft  Punk', 10)])
+        self.assertEqual(result['song_hits'], list(range(10)))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_smaller_limit(self):
+        self.cache.search('query', 10)
+        result = self.cache.search('query', 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(result['song_hits'], [0, 1, 2])
+        self.assertEqual(result['album_hits'], [0, 1, 2])
+        self.assertEqual(result['other'], 'kept')
+
+    def test_larger_limit(self):
+        self.cache.search('query', 3)
+        result = self.cache.search('query', 10)
+        self.assertEqual(self.calls, [('query', 3), ('query', 10)])
+        self.assertEqual(len(result['song_hits']), 10)
+        # The larger results replace the smaller ones.
+        self.cache.search('query', 5)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_expired(self):
+        self.cache.configure(2, ttls={'search': -1})
+        self.cache.search('query', 3)
+        self.cache.search('query', 3)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_evicted(self):
+        for query in ('a', 'b', 'c', 'a'):
+            self.cache.search(query, 1)
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
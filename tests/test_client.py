@@ -0,0 +1,49 @@
+from gpymusic import view
+from gpymusic.client import Client
+
+import unittest
+
+
+class TestParseNums(unittest.TestCase):
+    """Parse the item numbers given to commands like queue."""
+
+    def test_numbers_and_ranges(self):
+        self.assertEqual(Client.parse_nums('3'), [3])
+        self.assertEqual(Client.parse_nums('1 5-7 2'), [1, 5, 6, 7, 2])
+        self.assertEqual(Client.parse_nums('4-2'), [4, 3, 2])
+        self.assertEqual(Client.parse_nums('2-2 2'), [2, 2])
+        self.assertEqual(Client.parse_nums(''), [])
+
+    def test_malformed(self):
+        for arg in ('a', '1-', '-3', '1-2-3', '1 x'):
+            with self.assertRaises(ValueError, msg=arg):
+                Client.parse_nums(arg)
+
+    def test_limit(self):
+        self.assertEqual(Client.parse_nums('1-5', 5), [1, 2, 3, 4, 5])
+        for arg in ('0', '6', '3-6', '0-2'):
+            with self.assertRaises(IndexError, msg=arg):
+                Client.parse_nums(arg, 5)
+
+    def test_huge_range_rejected_first(self):
+        # Checked against the limit before it's expanded.
+        with self.assertRaises(IndexError):
+            Client.parse_nums('1-1000000000000', 100)
+
+
+class TestLocate(unittest.TestCase):
+    """Find numbered items in the main window's lists."""
+
+    def test_locate(self):
+        v = view.View({
+            'songs': ['s1', 's2'], 'artists': [], 'albums': ['a1'],
+        })
+        self.assertEqual(v.locate(1), ('songs', 0))
+        self.assertEqual(v.locate(2), ('songs', 1))
+        self.assertEqual(v.locate(3), ('albums', 0))
+        for num in (0, -1, 4):
+            self.assertIsNone(v.locate(num))
+
+
+if __name__ == '__main__':
+    unittest.main()
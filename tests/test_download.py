@@ -0,0 +1,77 @@
+from gpymusic import download
+
+from os.path import isfile, join
+from tempfile import TemporaryDirectory
+from threading import Event
+
+import unittest
+
+
+class FakeResponse():
+    """A streamed response which waits to be told to send its last chunk."""
+
+    def __init__(self, chunks, release, length):
+        """
+        FakeResponse constructor.
+
+        Arguments:
+        chunks: List of byte strings to send.
+        release: Event to wait on before sending the last chunk.
+        length: Number of bytes to promise.
+        """
+        self.chunks = chunks
+        self.release = release
+        self.headers = {'Content-Length': str(length)}
+
+    def iter_content(self, size):
+        """Yield the chunks, holding back the last one until released."""
+        for i, chunk in enumerate(self.chunks):
+            if i == len(self.chunks) - 1:
+                self.release.wait(5)
+            yield chunk
+
+
+class TestDownload(unittest.TestCase):
+    """Download songs from a stubbed stream."""
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = join(self.tmp.name, 'song.mp3')
+        self.release = Event()
+        self.chunks = [b'a' * download.BUFFER_SIZE, b'b' * 10]
+        self.length = download.BUFFER_SIZE + 10
+        self.open_url = download.open_url
+        download.open_url = lambda url: FakeResponse(
+            self.chunks, self.release, self.length
+        )
+
+    def tearDown(self):
+        download.open_url = self.open_url
+        self.tmp.cleanup()
+
+    def test_playable_path_outlives_download(self):
+        dl = download.start(None, 'id', self.path, url='url')
+        self.assertTrue(dl.wait(download.BUFFER_SIZE, timeout=5))
+        # mpv is given the path now, but might not open it until later.
+        source = dl.playable_path
+        self.release.set()
+        self.assertTrue(dl.finished.wait(5))
+        self.assertIsNone(dl.error)
+        self.assertTrue(source.startswith('appending://'))
+        self.assertTrue(isfile(source[len('appending://'):]))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(self.chunks))
+        self.assertNotIn(self.path, download.active)
+
+    def test_failed_download_is_removed(self):
+        self.length += 1  # Ends early.
+        self.release.set()
+        dl = download.start(None, 'id', self.path, url='url')
+        self.assertTrue(dl.finished.wait(5))
+        self.assertIsNotNone(dl.error)
+        self.assertFalse(dl.wait(download.BUFFER_SIZE))
+        self.assertFalse(isfile(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from gpymusic import index
+
+import unittest
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Search a small library's index."""
+
+    def setUp(self):
+        self.index = index.SearchIndex()
+        self.index.add('1', 'Hello World', 'Abba', 'Gold')
+        self.index.add('2', 'Yellow', 'Coldplay', 'Parachutes')
+        self.index.add('3', 'Gold', 'Spandau Ballet', 'True')
+        self.index.add('4', 'Golden Brown', 'The Stranglers', 'La Folie')
+
+    def test_ranking(self):
+        # Whole fields first, names before albums, then word starts.
+        self.assertEqual(self.index.search('gold'), ['3', '1', '4'])
+        self.assertEqual(self.index.search('GOLD', limit=1), ['3'])
+
+    def test_substrings(self):
+        self.assertEqual(self.index.search('ello'), ['1', '2'])
+        self.assertEqual(self.index.search('nothing'), [])
+        self.assertEqual(self.index.search('  '), [])
+
+    def test_short_queries(self):
+        # Short queries match anywhere, like longer ones.
+        self.assertEqual(self.index.search('el'), ['1', '2'])
+        self.assertEqual(self.index.search('w'), ['1', '2', '4'])
+        self.assertEqual(self.index.search('q'), [])
+
+    def test_every_occurrence_ranked(self):
+        # 'gold' appears mid-word before it appears as a whole word.
+        self.index.add('5', 'Marigold Gold', 'X', 'Y')
+        self.index.add('6', 'Marigolds', 'X', 'Y')
+        self.assertEqual(
+            self.index.search('gold'), ['3', '1', '5', '4', '6']
+        )
+
+    def test_replace_and_remove(self):
+        self.index.add('2', 'Fix You', 'Coldplay', 'X&Y')
+        self.assertEqual(self.index.search('yellow'), [])
+        self.assertEqual(self.index.search('fix'), ['2'])
+        self.index.remove('1')
+        self.index.remove('unknown')
+        self.assertEqual(self.index.search('hello'), [])
+        self.assertEqual(self.index.search('a'), ['3', '4', '2'])
+        self.assertEqual(len(self.index), 3)
+        self.assertNotIn('1', self.index)
+
+    def test_compact(self):
+        for n in range(3000):
+            self.index.add(str(n + 10), 'Song %d' % n, 'Artist', 'Album')
+        for n in range(3000):
+            self.index.remove(str(n + 10))
+        # Removed songs have been cleaned out of the postings.
+        self.assertLess(len(self.index.docs), 1100)
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search('gold'), ['3', '1', '4'])
+        self.assertEqual(self.index.search('song'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
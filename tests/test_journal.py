@@ -0,0 +1,100 @@
+from gpymusic import journal, music_objects, songqueue
+
+from os.path import join
+from tempfile import TemporaryDirectory
+
+import json
+import unittest
+
+
+def song(n):
+    """Make a library song numbered n."""
+    return music_objects.LibrarySong(
+        {'id': str(n), 'name': 'song %d' % n, 'artist': 'a', 'album': 'b'},
+        source='json'
+    )
+
+
+class TestJournal(unittest.TestCase):
+    """Record queue changes, and restore them as if after a crash."""
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = join(self.tmp.name, 'queue.journal')
+        self.queue = self.attach()
+
+    def tearDown(self):
+        self.queue.journal.f.close()
+        self.tmp.cleanup()
+
+    def attach(self, **kwargs):
+        """Make a Queue restored from the journal."""
+        queue = songqueue.Queue()
+        queue.attach(journal.Journal(self.path, **kwargs))
+        return queue
+
+    def restored(self):
+        """Replay the journal, and get the restored songs' ids."""
+        self.queue.journal.f.close()
+        return [s['id'] for s in journal.Journal(self.path).replay()]
+
+    def ops(self):
+        """Get the names of the changes in the journal."""
+        with open(self.path) as f:
+            return [json.loads(line)[0] for line in f]
+
+    def test_ops(self):
+        self.queue.extend([song(n) for n in range(6)])
+        self.queue.started(self.queue.advance())
+        self.queue.remove(1)
+        self.queue.move(0, 2)
+        self.queue.requeue([song(9)])
+        self.assertEqual(
+            self.ops(),
+            ['reset', 'add', 'advance', 'start', 'remove', 'move', 'front']
+        )
+        # front means playback stopped, so nothing is playing.
+        self.assertEqual(self.restored(), ['9', '3', '4', '1', '5'])
+
+    def test_playing_song_restored(self):
+        self.queue.extend([song(n) for n in range(3)])
+        self.queue.started(self.queue.advance())
+        # The player takes the next song before the current one ends.
+        self.queue.advance()
+        self.assertEqual(self.restored(), ['0', '1', '2'])
+
+    def test_skipped_songs_dropped(self):
+        self.queue.extend([song(n) for n in range(4)])
+        self.queue.advance()  # Couldn't be played, so it was skipped.
+        self.queue.started(self.queue.advance())
+        self.assertEqual(self.restored(), ['1', '2', '3'])
+
+    def test_compact(self):
+        self.queue.journal.f.close()
+        self.queue = self.attach(compact_after=3)
+        for n in range(6):
+            self.queue.append(song(n))
+            self.queue.started(self.queue.advance())
+        self.queue.extend([song(6), song(7)])
+        self.queue.advance()
+        ops = self.ops()
+        self.assertEqual(ops[0], 'reset')
+        self.assertLess(len(ops), 6)  # Rather than 21.
+        # Snapshots keep the playing song, and the one taken after it.
+        self.assertEqual(self.restored(), ['5', '6', '7'])
+
+    def test_truncated_line(self):
+        self.queue.extend([song(n) for n in range(2)])
+        self.queue.journal.f.write('["add", [{"id": "7", "na')
+        self.queue.journal.f.flush()
+        self.assertEqual(self.restored(), ['0', '1'])
+
+    def test_clear(self):
+        self.queue.extend([song(n) for n in range(2)])
+        self.queue.started(self.queue.advance())
+        self.queue.clear()
+        self.assertEqual(self.restored(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from gpymusic import library
+
+from os.path import join
+from tempfile import TemporaryDirectory
+
+import json
+import sqlite3
+import unittest
+import zipfile
+
+
+def song(id, name, artist='Artist', album='Album'):
+    """Make a song dict like the ones stored in a library."""
+    return {'id': id, 'name': name, 'artist': artist, 'album': album}
+
+
+class TestLibrary(unittest.TestCase):
+    """Store songs in a library database."""
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = join(self.tmp.name, 'library.db')
+        self.library = library.Library(self.path)
+
+    def tearDown(self):
+        self.library.close()
+        self.tmp.cleanup()
+
+    def test_upsert_and_get(self):
+        self.library.upsert([song('1', 'One'), song('2', 'Two')])
+        self.assertEqual(len(self.library), 2)
+        self.assertIn('1', self.library)
+        one = self.library.get('1')
+        self.assertEqual(one['name'], 'One')
+        self.assertEqual(one['kind'], 'libsong')
+        self.assertIs(self.library.get('1'), one)  # Shared.
+        self.assertIsNone(self.library.get('3'))
+
+        # Replacing a song gets rid of the old copy.
+        self.library.upsert([song('1', 'Uno')], {'1': 'abc'})
+        self.assertEqual(len(self.library), 2)
+        self.assertEqual(self.library.get('1')['name'], 'Uno')
+        self.assertEqual(self.library.fingerprints(), {'1': 'abc', '2': None})
+
+    def test_remove(self):
+        self.library.upsert([song('1', 'One'), song('2', 'Two')])
+        self.library.get('1')
+        self.library.remove(['1', 'unknown'])
+        self.assertNotIn('1', self.library)
+        self.assertIsNone(self.library.get('1'))
+        self.assertEqual([r[0] for r in self.library.rows(size=1)], ['2'])
+
+    def test_persists(self):
+        self.library.upsert([song('1', 'One')])
+        self.assertIsNone(self.library.last_sync)
+        self.library.mark_synced()
+        self.library.close()
+        self.library = library.Library(self.path)
+        self.assertEqual(self.library.get('1')['name'], 'One')
+        self.assertIsNotNone(self.library.last_sync)
+
+    def test_old_schema(self):
+        self.library.close()
+        db = sqlite3.connect(self.path)
+        db.execute('DROP TABLE songs')
+        db.execute(
+            'CREATE TABLE songs (id TEXT PRIMARY KEY, name TEXT, '
+            'artist TEXT, album TEXT)'
+        )
+        db.commit()
+        db.close()
+        self.library = library.Library(self.path)
+        self.library.upsert([song('1', 'One')], {'1': 'abc'})
+        self.assertEqual(self.library.fingerprints(), {'1': 'abc'})
+
+    def test_migrate(self):
+        path = join(self.tmp.name, 'library.zip')
+        with zipfile.ZipFile(path, 'w') as z:
+            z.writestr('library.json', json.dumps({
+                'songs': [song('1', 'One'), song('2', 'Two')]
+            }))
+        self.assertTrue(self.library.migrate(path))
+        self.assertEqual(len(self.library), 2)
+
+        with open(path, 'w') as f:
+            f.write('not a zip file')
+        self.assertFalse(self.library.migrate(path))
+
+    def test_search(self):
+        self.library.upsert([
+            song('2', 'Other', 'X', 'Greatest Hits'),
+            song('3', 'Hits', 'X', 'Y'),
+            song('4', '100% Pure', 'X', 'Y'),
+            song('5', '1000 Pure', 'X', 'Y'),
+            song('6', 'snake_case', 'X', 'Y'),
+            song('7', 'snakescase', 'X', 'Y'),
+        ])
+        # Names before albums.
+        self.assertEqual(self.library.search('hits'), ['3', '2'])
+        self.assertEqual(self.library.search('HITS', limit=1), ['3'])
+        self.assertEqual(self.library.search('  '), [])
+        # Wildcards only match themselves.
+        self.assertEqual(self.library.search('0%'), ['4'])
+        self.assertEqual(self.library.search('e_c'), ['6'])
+        self.assertEqual(self.library.search('!'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+from gpymusic import player
+
+from os.path import dirname, join
+from threading import Event
+
+import sys
+import unittest
+
+
+FAKE_MPV = join(dirname(__file__), 'fake_mpv.py')
+LENGTH = 1.5  # Seconds that the fake plays each song for.
+
+
+class Feed():
+    """Hands out numbered songs, and records what the player does."""
+
+    def __init__(self, n, log=None):
+        """
+        Feed constructor.
+
+        Arguments:
+        n: Number of songs to hand out.
+
+        Keyword arguments:
+        log=None: List to record (feed, 'fed'/'finished') in, to check
+          the order of calls across feeds.
+        """
+        self.log = log if log is not None else []
+        self.songs = list(range(n))
+        self.fed = []
+        self.started = []
+        self.result = None  # (stopped, unstarted) once playback ends.
+        self.done = Event()
+        self.second_fed = Event()
+
+    def __call__(self):
+        """Get the next (source, song), or None when there are no more."""
+        if not self.songs:
+            return None
+        song = self.songs.pop(0)
+        self.fed.append(song)
+        self.log.append((self, 'fed'))
+        if len(self.fed) == 2:
+            self.second_fed.set()
+        return 'song-%d.mp3' % song, song
+
+    def start(self, song):
+        """Record that a song started."""
+        self.started.append(song)
+
+    def finish(self, stopped, unstarted):
+        """Record how playback ended."""
+        self.result = (stopped, unstarted)
+        self.log.append((self, 'finished'))
+        self.done.set()
+
+
+class TestPlayer(unittest.TestCase):
+    """Drive Player against a fake mpv over its IPC socket."""
+
+    def setUp(self):
+        # Load each next song as soon as the one before it starts.
+        self.preload = player.Player.preload
+        player.Player.preload = LENGTH * 10
+        self.player = player.Player(
+            command=(sys.executable, FAKE_MPV, '--length=%s' % LENGTH)
+        )
+
+    def tearDown(self):
+        self.player.close()
+        player.Player.preload = self.preload
+
+    def play(self, n, log=None):
+        """Play n songs from a new Feed, and return the Feed."""
+        feed = Feed(n, log)
+        self.assertTrue(
+            self.player.play(feed, started=feed.start, finished=feed.finish)
+        )
+        return feed
+
+    def test_gapless(self):
+        feed = self.play(3)
+        self.assertTrue(feed.done.wait(LENGTH * 3 + 5))
+        # mpv goes idle as soon as it runs out of songs, so if every song
+        # started, each was appended before the one before it ended.
+        self.assertEqual(feed.started, [0, 1, 2])
+        self.assertEqual(feed.result, (False, []))
+        self.assertFalse(self.player.playing)
+
+    def test_stop_requeues(self):
+        feed = self.play(3)
+        self.assertTrue(feed.second_fed.wait(LENGTH))
+        self.player.stop()
+        self.assertTrue(feed.done.wait(5))
+        # The appended song never started, so it's handed back.
+        self.assertEqual(feed.started, [0])
+        self.assertEqual(feed.result, (True, [1]))
+        self.assertEqual(feed.songs, [2])
+        self.assertFalse(self.player.playing)
+
+    def test_session_ends(self):
+        feed = self.play(1)
+        self.assertTrue(feed.done.wait(LENGTH + 5))
+        self.assertEqual(feed.started, [0])
+        self.assertEqual(feed.result, (False, []))
+        self.assertFalse(self.player.playing)
+
+        # The same mpv plays the next session.
+        feed = self.play(1)
+        self.assertTrue(feed.done.wait(LENGTH + 5))
+        self.assertEqual(feed.started, [0])
+
+    def test_replaced_session_ends(self):
+        first = self.play(3)
+        self.assertTrue(first.second_fed.wait(LENGTH))
+        second = self.play(1)
+        self.assertTrue(first.done.wait(1))
+        self.assertEqual(first.result, (True, [1]))
+        self.assertTrue(second.done.wait(LENGTH + 5))
+        self.assertEqual(second.started, [0])
+
+    def test_replaced_session_ends_first(self):
+        log = []
+        first = self.play(3, log)
+        self.assertTrue(first.second_fed.wait(LENGTH))
+        second = self.play(1, log)
+        # Songs handed back by the old session go ahead of the new one's.
+        self.assertLess(
+            log.index((first, 'finished')), log.index((second, 'fed'))
+        )
+        self.assertTrue(second.done.wait(LENGTH + 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
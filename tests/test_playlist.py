@@ -0,0 +1,97 @@
+from gpymusic import playlist
+
+from os.path import getsize, join
+from tempfile import TemporaryDirectory
+
+import json
+import unittest
+
+
+ARTIST = {
+    'id': 'a1', 'name': 'Artist', 'kind': 'artist', 'full': False,
+    'songs': [], 'albums': [],
+}
+ALBUM = {
+    'id': 'b1', 'name': 'Album', 'kind': 'album', 'full': False,
+    'artist': ARTIST, 'songs': [],
+}
+
+
+def song(n, kind='song'):
+    """Make a song dict like the ones to_dict() writes."""
+    return {
+        'id': 'id%d' % n, 'name': 'Song %d é' % n, 'kind': kind,
+        'full': True, 'artist': ARTIST, 'album': ALBUM, 'time': '03:0%d' % n,
+    }
+
+
+class TestPlaylist(unittest.TestCase):
+    """Write and read playlists in the compact format."""
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = join(self.tmp.name, 'playlist')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        songs = [song(1), song(2, 'libsong'), song(3)]
+        self.assertEqual(playlist.save(self.path, songs), 3)
+        self.assertTrue(playlist.is_compact(self.path))
+        self.assertEqual(list(playlist.load(self.path)), songs)
+
+    def test_shared_items_written_once(self):
+        playlist.save(self.path, [song(1)])
+        one = getsize(self.path)
+        playlist.save(self.path, [song(n) for n in range(5)])
+        # Later songs only add their own fields.
+        self.assertLess(getsize(self.path) - one, 4 * 40)
+
+    def test_other_kinds_skipped(self):
+        self.assertEqual(playlist.save(self.path, [ARTIST, song(1)]), 1)
+        self.assertEqual([s['id'] for s in playlist.load(self.path)], ['id1'])
+
+    def test_truncated(self):
+        playlist.save(self.path, [song(n) for n in range(3)])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-3])
+        # Songs before the cut are still read.
+        self.assertEqual(
+            [s['id'] for s in playlist.load(self.path)], ['id0', 'id1']
+        )
+
+    def test_bad_magic(self):
+        with open(self.path, 'w') as f:
+            json.dump([song(1)], f)
+        self.assertFalse(playlist.is_compact(self.path))
+        with self.assertRaises(ValueError):
+            list(playlist.load(self.path))
+
+    def test_corrupt(self):
+        with open(self.path, 'wb') as f:
+            f.write(playlist.MAGIC + b'X')
+        with self.assertRaises(ValueError):
+            list(playlist.load(self.path))
+
+    def test_convert(self):
+        full_album = dict(ALBUM, full=True, songs=[song(9)])
+        old = [dict(song(1), album=full_album), song(2), {'id': 'bad'}, 5]
+        with open(self.path, 'w') as f:
+            json.dump(old, f)
+        self.assertEqual(playlist.convert(self.path, self.path), 2)
+        self.assertTrue(playlist.is_compact(self.path))
+        songs = list(playlist.load(self.path))
+        # Nested items are cut down to stubs.
+        self.assertEqual(songs, [song(1), song(2)])
+
+        with open(self.path, 'w') as f:
+            json.dump({'not': 'a playlist'}, f)
+        with self.assertRaises(ValueError):
+            playlist.convert(self.path, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()